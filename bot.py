@@ -4,12 +4,14 @@ import discord
 from discord import activity
 from discord.ext import commands, ipc
 from cogs.utils.context import Context
+from cogs.utils.pool import MonitoredPool, long_running, pool_label
 import traceback
 import logging
 import config
 import sys
 
 import aiohttp
+import asyncio
 import asyncpg
 
 log = logging.getLogger(__name__)
@@ -19,7 +21,8 @@ startup_cogs = [
     'cogs.stats',
     'cogs.owner',
     'cogs.info',
-    'cogs.ipc'
+    'cogs.ipc',
+    'cogs.metrics'
 ]
 
 
@@ -32,9 +35,12 @@ def _prefix_callable(bot: commands.Bot, msg: discord.Message):
 
 
 class Netero(commands.Bot):
-    pool: asyncpg.Pool
+    pool: MonitoredPool
     command_stats: Counter[str]
+    command_latency: dict[str, Any]
     socket_stats: Counter[str]
+    gateway_stats: Any
+    counters: Any
     gateway_handler: Any
     bot_app_info: discord.AppInfo
 
@@ -70,6 +76,7 @@ class Netero(commands.Bot):
                               645690086893158429, 645689982677155840, 645690039908696065, 645689931313971210,
                               645690394910130217, 645690451696943124, 645690495078760469]
         self.logging_channel = 992146724002996314
+        self.before_invoke(self.mark_invoked)
         # create our IPC Server
 
     async def setup_hook(self):
@@ -81,6 +88,13 @@ class Netero(commands.Bot):
                 log.warn(f'Failed to load {cog}.')
                 traceback.print_exc()
 
+    async def mark_invoked(self, ctx: Context) -> None:
+        # runs after the checks and converters, right before the callback
+        ctx.invoked_at = asyncio.get_running_loop().time()
+        # connections acquired from here on are attributed to the command
+        pool_label.set(ctx.command.qualified_name)
+        long_running.set(ctx.command.extras.get('long_running', False))
+
     async def on_command_error(self, ctx: commands.Context, error: commands.CommandError) -> None:
         if isinstance(error, commands.NoPrivateMessage):
             await ctx.author.send('This command cannot be used in private messages.')
@@ -25,7 +25,10 @@ class IpcRoutes(commands.Cog):
 
     @ipc.server.route()
     async def get_user_count(self, data):
-        return {'user_count': sum(1 for _ in self.bot.get_all_members())}
+        counters = getattr(self.bot, 'counters', None)
+        if counters is None:
+            return {'user_count': sum(1 for _ in self.bot.get_all_members())}
+        return {'user_count': counters.members}
 
     @ipc.server.route()
     async def get_guild_ids(self, data):
@@ -1,11 +1,15 @@
 import asyncio
+import logging
+import math
 import sys
 import traceback
 from typing import List
 
+import asyncpg
+
 from cogs.owner import MY_GUILD
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 
 import config
 
@@ -13,7 +17,12 @@ import asyncio
 
 
 from .utils import time, db
+from .utils import formats
+from .utils.formats import TabularData
+from .utils.paginate import SimplePages
+from .utils.cache import ExpiringCache
 from .utils.embed import FooterEmbed
+from .utils.emotes import get_emote_strings
 from .utils.riot import VERSION
 from .utils.exceptions import RegionException
 import pyot
@@ -23,6 +32,45 @@ from pyot.models import lol
 from pyot.utils.lol.routing import platform_to_region
 
 from cogs.utils import riot
+from cogs.utils import watcher
+from cogs.utils.pool import BACKGROUND, pool_label
+from cogs.utils.matchstats import COLUMNS as MATCH_COLUMNS, MatchFrame, summarise
+from pyot.core.exceptions import NotFound
+
+log = logging.getLogger(__name__)
+
+# Summoners whose rank changed recently are refreshed more often. Every
+# puuid gets a fixed offset within its period so the refreshes are spread
+# evenly across the hour instead of bursting every time the loop runs.
+RANK_ACTIVE_WINDOW = timedelta(hours=6)
+RANK_ACTIVE_PERIOD = 15 * 60
+RANK_IDLE_PERIOD = 60 * 60
+RANK_REFRESH_LIMIT = 500
+RANK_REFRESH_BATCH = 20
+WATCH_BUDGET = getattr(config, 'watch_budget', 300.0)
+WATCH_TICK = 5.0
+RANKED_QUEUES = {420: 'solo/duo', 440: 'flex'}
+CHAMPS_MATCHES = 100
+CHAMPS_SHOWN = 10
+LP_GRAPH_DAYS = 30
+LP_GRAPH_WIDTH = 48
+
+
+def _resample(points, start: datetime, end: datetime, width: int) -> List[int]:
+    """Turns irregular (recorded, score) points into ``width`` evenly spaced values.
+    Every value is the last score recorded at or before that moment.
+    """
+    step = (end - start) / width
+    values = []
+    index = 0
+    current = points[0][1]
+    for column in range(width):
+        moment = start + step * (column + 1)
+        while index < len(points) and points[index][0] <= moment:
+            current = points[index][1]
+            index += 1
+        values.append(current)
+    return values
 
 
 # class Players(db.Table):
@@ -49,6 +97,65 @@ class Summoner(db.Table):
     region = db.Column(db.String)
     # discord
     account_id = db.Column(db.String)
+    puuid = db.Column(db.String, index=True)
+    name = db.Column(db.String)
+
+
+class SummonerRanks(db.Table, table_name='summoner_ranks'):
+    # latest solo/duo snapshot of every linked summoner
+    puuid = db.Column(db.String, primary_key=True)
+    summoner_id = db.Column(db.String)
+    region = db.Column(db.String)
+    name = db.Column(db.String)
+    tier = db.Column(db.String)
+    division = db.Column(db.String)
+    lp = db.Column(db.Integer)
+    wins = db.Column(db.Integer)
+    losses = db.Column(db.Integer)
+    score = db.Column(db.Integer, index=True)
+    updated = db.Column(db.Datetime, index=True)
+    # last time the score or the amount of games played changed
+    changed = db.Column(db.Datetime)
+
+
+class WatchChannels(db.Table, table_name='watch_channels'):
+    # live game notifications of linked members are posted here
+    guild_id = db.Column(db.Integer(big=True), primary_key=True)
+    channel_id = db.Column(db.Integer(big=True))
+
+
+class MatchSummaries(db.Table, table_name='match_summaries'):
+    # one row per player per match, see utils.matchstats.summarise
+    puuid = db.Column(db.String, primary_key=True)
+    match_id = db.Column(db.String, primary_key=True)
+    played = db.Column(db.Datetime, index=True)
+    queue_id = db.Column(db.Integer)
+    champion = db.Column(db.String)
+    role = db.Column(db.String)
+    win = db.Column(db.Boolean)
+    kills = db.Column(db.Integer(small=True))
+    deaths = db.Column(db.Integer(small=True))
+    assists = db.Column(db.Integer(small=True))
+    cs = db.Column(db.Integer(small=True))
+    duration = db.Column(db.Integer)
+    damage = db.Column(db.Integer)
+    team_damage = db.Column(db.Integer)
+
+
+class LPHistory(db.Table, table_name='lp_history'):
+    # only written when a snapshot differs from the previous one
+    puuid = db.Column(db.String, primary_key=True)
+    recorded = db.Column(db.Datetime, primary_key=True)
+    score = db.Column(db.Integer)
+    wins = db.Column(db.Integer)
+    losses = db.Column(db.Integer)
+
+
+MEDALS = (
+    '\N{FIRST PLACE MEDAL}',
+    '\N{SECOND PLACE MEDAL}',
+    '\N{THIRD PLACE MEDAL}',
+)
 
 
 class League(commands.Cog):
@@ -61,6 +168,20 @@ class League(commands.Cog):
         self.waiting_embed.set_thumbnail(
             url='https://raw.githubusercontent.com/RubenPeeters/Netero/main/cogs/assets/netero_waiting.gif')
         self.riot_data = riot.StaticData()
+        self.watch = watcher.WatchScheduler(budget=WATCH_BUDGET, tick=WATCH_TICK)
+        # (game_id, puuid, event) of every announcement that went out
+        self._announced: ExpiringCache[tuple[int, str, str], bool] = ExpiringCache(
+            seconds=6 * 3600.0, maxsize=20000)
+        self.refresh_ranks.add_exception_type(*db.UNREACHABLE)
+        self.refresh_ranks.start()
+        self.refresh_watchlist.add_exception_type(*db.UNREACHABLE)
+        self.refresh_watchlist.start()
+        self.poll_watched.start()
+
+    def cog_unload(self):
+        self.refresh_ranks.cancel()
+        self.refresh_watchlist.cancel()
+        self.poll_watched.cancel()
 
     async def on_command_error(self, ctx: commands.Context, error: commands.CommandError) -> None:
         await ctx.send(str(error))
@@ -73,29 +194,468 @@ class League(commands.Cog):
             name='Whoops...', value="This command cannot be used without a subcommand.")
         await ctx.reply(embed=embed)
 
-    # @league.command(name="add")
-    # async def add(self, ctx, region: str, *, name: str):
-    #     """Link a league of legends summoner to your discord account."""
-    #     query = """
-    #                 INSERT INTO Summoner (summoner_id, region, account_id)
-    #                 VALUES ($1, $2, $3);
-    #             """
-    #     summoner = PantheonPlayer(
-    #         region=region, name=name, bot=self.bot)
-    #     await summoner.initialize_player_object(ranks=False, match=False, data=False)
-    #     try:
-    #         await ctx.db.execute(query, summoner.summoner_id, summoner.region, str(ctx.author.id))
-    #     except Exception as e:
-    #         print(e)
-    #         await ctx.send('Could not link account.')
-    #         return
-
-    #     message = await ctx.send(embed=self.waiting_embed)
-    #     embed = FooterEmbed(self.bot, title='Succes!',
-    #                         description=f'{summoner.name} is now linked to your account with region {region.upper()}.')
-    #     embed.set_author(
-    #         name=f'{summoner.name}', icon_url=f'http://ddragon.leagueoflegends.com/cdn/{VERSION}/img/profileicon/{summoner.profile_icon_id}.png')
-    #     await message.edit(embed=embed)
+    async def snapshot_ranks(self, summoner_id: str, region: str, puuid: str, name: str):
+        """Fetches the solo/duo entry of a summoner and stores it as its latest snapshot.
+        A row is only added to the LP history when the snapshot actually changed.
+        Returns the ``(score, wins, losses)`` before and after the refresh.
+        """
+        leagues = await riot.fetch_league_entries(summoner_id, region)
+        entry = riot.solo_entry(leagues)
+        if entry is None:
+            tier = division = None
+            lp = wins = losses = score = None
+        else:
+            tier, division, lp = entry.tier, entry.rank, entry.league_points
+            wins, losses = entry.wins, entry.losses
+            score = riot.rank_score(tier, division, lp)
+        after = (score, wins, losses)
+
+        async with self.bot.pool.acquire() as con:
+            async with con.transaction():
+                query = "SELECT score, wins, losses FROM summoner_ranks WHERE puuid=$1 FOR UPDATE;"
+                record = await con.fetchrow(query, puuid)
+                before = tuple(record) if record is not None else None
+                changed = before != after
+
+                query = """INSERT INTO summoner_ranks (puuid, summoner_id, region, name, tier, division, lp, wins, losses, score, updated, changed)
+                           VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, now() at time zone 'utc', now() at time zone 'utc')
+                           ON CONFLICT (puuid) DO UPDATE
+                           SET summoner_id = EXCLUDED.summoner_id,
+                               name = EXCLUDED.name,
+                               tier = EXCLUDED.tier,
+                               division = EXCLUDED.division,
+                               lp = EXCLUDED.lp,
+                               wins = EXCLUDED.wins,
+                               losses = EXCLUDED.losses,
+                               score = EXCLUDED.score,
+                               updated = EXCLUDED.updated,
+                               changed = CASE WHEN $11 THEN EXCLUDED.changed ELSE summoner_ranks.changed END;
+                        """
+                await con.execute(query, puuid, summoner_id, region, name, tier, division, lp, wins, losses, score, changed)
+
+                if changed and score is not None:
+                    query = """INSERT INTO lp_history (puuid, recorded, score, wins, losses)
+                               VALUES ($1, now() at time zone 'utc', $2, $3, $4);
+                            """
+                    await con.execute(query, puuid, score, wins, losses)
+
+        return before, after
+
+    async def refresh_linked(self, record) -> None:
+        summoner_id, region, puuid, name = record['summoner_id'], record['region'], record['puuid'], record['name']
+        if puuid is None:
+            # links made before puuids were stored
+            async with riot.scheduler.slot(region):
+                summoner = await lol.Summoner(id=summoner_id, platform=region).get()
+            puuid, name = summoner.puuid, summoner.name
+            query = "UPDATE summoner SET puuid=$1, name=$2 WHERE summoner_id=$3 AND region=$4;"
+            await self.bot.pool.execute(query, puuid, name, summoner_id, region)
+        await self.snapshot_ranks(summoner_id, region, puuid, name)
+
+    @tasks.loop(minutes=1.0)
+    async def refresh_ranks(self):
+        pool_label.set(BACKGROUND)
+        # Only snapshots that passed their slot are refreshed, so the leaderboard
+        # and graphs never have to hit the API no matter how many accounts are linked.
+        # A snapshot is due once the current time crossed a period boundary,
+        # shifted by the puuid's offset, that the last update hadn't crossed yet.
+        query = """WITH tracked AS (
+                       SELECT DISTINCT ON (s.summoner_id, s.region) s.summoner_id, s.region, s.puuid, s.name, r.updated,
+                              CASE WHEN r.changed > (now() at time zone 'utc') - $1::interval
+                                   THEN $2::int ELSE $3::int END AS period,
+                              hashtext(s.puuid) & 2147483647 AS slot
+                       FROM summoner s
+                       LEFT JOIN summoner_ranks r ON r.puuid = s.puuid
+                   )
+                   SELECT summoner_id, region, puuid, name
+                   FROM tracked
+                   WHERE updated IS NULL
+                   OR floor((extract(epoch FROM now() at time zone 'utc') - slot % period) / period)
+                    > floor((extract(epoch FROM updated) - slot % period) / period)
+                   ORDER BY updated NULLS FIRST
+                   LIMIT $4;
+                """
+        try:
+            records = await self.bot.pool.fetch(query, RANK_ACTIVE_WINDOW, RANK_ACTIVE_PERIOD,
+                                                RANK_IDLE_PERIOD, RANK_REFRESH_LIMIT)
+        except asyncpg.PostgresError:
+            log.exception('Could not look up the summoners due for a rank refresh.')
+            return
+        for i in range(0, len(records), RANK_REFRESH_BATCH):
+            batch = records[i:i + RANK_REFRESH_BATCH]
+            results = await asyncio.gather(*(self.refresh_linked(record) for record in batch), return_exceptions=True)
+            for record, result in zip(batch, results):
+                if isinstance(result, Exception):
+                    log.warning('Could not refresh ranks of %s (%s): %s',
+                                record['summoner_id'], record['region'], result)
+
+    @refresh_ranks.before_loop
+    async def before_refresh_ranks(self):
+        await self.bot.wait_until_ready()
+
+    @tasks.loop(minutes=5.0)
+    async def refresh_watchlist(self):
+        # watch and unwatch restart this from their own task, don't attribute it to them
+        pool_label.set(BACKGROUND)
+        try:
+            await self.sync_watchlist()
+        except asyncpg.PostgresError:
+            # the current watch list is kept until the next refresh
+            log.exception('Could not refresh the watch list.')
+
+    async def sync_watchlist(self) -> None:
+        query = "SELECT guild_id, channel_id FROM watch_channels;"
+        records = await self.bot.pool.fetch(query)
+        channels: dict[str, set[int]] = {}
+        for guild_id, channel_id in records:
+            guild = self.bot.get_guild(guild_id)
+            if guild is None or guild.get_channel(channel_id) is None:
+                continue
+            for member in guild.members:
+                channels.setdefault(str(member.id), set()).add(channel_id)
+
+        if not channels:
+            self.watch.sync([])
+            return
+
+        query = """SELECT account_id, summoner_id, region, puuid, name
+                   FROM summoner
+                   WHERE account_id = ANY($1::text[])
+                   AND puuid IS NOT NULL;
+                """
+        records = await self.bot.pool.fetch(query, list(channels))
+        self.watch.sync(
+            (r['summoner_id'], r['region'], r['puuid'], r['name'], (channel_id, r['account_id']))
+            for r in records
+            for channel_id in channels[r['account_id']]
+        )
+
+    @refresh_watchlist.before_loop
+    async def before_refresh_watchlist(self):
+        await self.bot.wait_until_ready()
+
+    @tasks.loop(seconds=WATCH_TICK)
+    async def poll_watched(self):
+        pool_label.set(BACKGROUND)
+        # every platform has its own rate bucket, so the batches run side by side
+        batches = self.watch.due()
+        await asyncio.gather(*(self.poll_batch(players) for players in batches.values()))
+
+    @poll_watched.before_loop
+    async def before_poll_watched(self):
+        await self.bot.wait_until_ready()
+
+    async def poll_batch(self, players: List[watcher.WatchedPlayer]) -> None:
+        results = await asyncio.gather(*(self.poll_player(player) for player in players), return_exceptions=True)
+        for player, result in zip(players, results):
+            self.watch.reschedule(player)
+            if isinstance(result, Exception):
+                log.warning('Could not poll live game of %s (%s): %s', player.name, player.region, result)
+
+    async def poll_player(self, player: watcher.WatchedPlayer) -> None:
+        try:
+            async with riot.scheduler.slot(player.region):
+                game = await lol.CurrentGame(summoner_id=player.summoner_id, platform=player.region).get()
+        except NotFound:
+            game = None
+
+        if game is not None and game.id != player.game_id:
+            if player.game_id is not None:
+                # went straight from one game into the next between two polls
+                player.end_game()
+            champion_id = next((p.champion_id for p in game.participants
+                                if p.summoner_id == player.summoner_id), None)
+            player.start_game(game.id, game.queue_id, champion_id)
+            await self.announce_start(player)
+        elif game is None and player.game_id is not None:
+            player.end_game()
+
+        if player.pending is not None:
+            await self.finish_game(player)
+
+    async def notify(self, player: watcher.WatchedPlayer, content: str) -> None:
+        for channel_id in {channel_id for channel_id, _ in player.targets}:
+            channel = self.bot.get_channel(channel_id)
+            if channel is None:
+                continue
+            try:
+                await channel.send(content, allowed_mentions=discord.AllowedMentions.none())
+            except discord.HTTPException as e:
+                log.info('Could not post live game update in %s: %s', channel_id, e)
+
+    async def announce_start(self, player: watcher.WatchedPlayer) -> None:
+        queue = RANKED_QUEUES.get(player.queue_id)
+        key = (player.game_id, player.puuid, 'start')
+        if queue is None or key in self._announced:
+            return
+        self._announced[key] = True
+        champion = riot.get_champ_name_from_id(player.champion_id, self.riot_data) or 'an unknown champion'
+        emote = get_emote_strings(riot.get_champ_from_id(player.champion_id, self.riot_data), self.bot)
+        await self.notify(player, f'\N{CROSSED SWORDS} **{player.name}** just started a ranked {queue} game as {emote} {champion}.')
+
+    async def finish_game(self, player: watcher.WatchedPlayer) -> None:
+        game_id, queue_id, champion_id = player.pending
+        queue = RANKED_QUEUES.get(queue_id)
+        key = (game_id, player.puuid, 'end')
+        if queue is None or key in self._announced:
+            player.finish()
+            return
+
+        player.attempts += 1
+        last_attempt = player.attempts >= watcher.FINISH_ATTEMPTS
+        try:
+            async with riot.scheduler.slot(platform_to_region(player.region)):
+                match = await lol.Match(id=f'{player.region.upper()}_{game_id}',
+                                        region=platform_to_region(player.region)).get()
+        except NotFound:
+            # the match isn't available right after the game ends
+            if last_attempt:
+                player.finish()
+            return
+
+        participant = next((p for p in match.info.participants if p.puuid == player.puuid), None)
+        if participant is None:
+            player.finish()
+            return
+
+        lp = ''
+        if queue_id == 420:
+            riot.league_cache.pop((player.region, player.summoner_id))
+            before, after = await self.snapshot_ranks(player.summoner_id, player.region, player.puuid, player.name)
+            if before == after and not last_attempt:
+                # ranks lag behind the match result, try again on the next poll
+                return
+            if before is not None and before[0] is not None and after[0] is not None and before != after:
+                lp = f' {after[0] - before[0]:+} LP'
+
+        self._announced[key] = True
+        player.finish()
+        emoji = '\N{LARGE BLUE CIRCLE}' if participant.win else '\N{LARGE RED CIRCLE}'
+        result = 'won' if participant.win else 'lost'
+        emote = get_emote_strings(participant.champion_name, self.bot)
+        await self.notify(player, f'{emoji} **{player.name}** finished a ranked {queue} game: {result}{lp} '
+                                  f'({participant.kills}/{participant.deaths}/{participant.assists} as {emote} {participant.champion_name}).')
+
+    @league.command(name="watch")
+    @commands.guild_only()
+    @commands.has_guild_permissions(manage_guild=True)
+    async def watch(self, ctx, channel: discord.TextChannel = None):
+        """Post live ranked game updates of linked members in a channel."""
+        channel = channel or ctx.channel
+        await WatchChannels.upsert(ctx.db, guild_id=ctx.guild.id, channel_id=channel.id)
+        await ctx.send(f'Live game updates of linked members will be posted in {channel.mention}.')
+        self.refresh_watchlist.restart()
+
+    @league.command(name="unwatch")
+    @commands.guild_only()
+    @commands.has_guild_permissions(manage_guild=True)
+    async def unwatch(self, ctx):
+        """Stop posting live ranked game updates in this server."""
+        query = "DELETE FROM watch_channels WHERE guild_id=$1;"
+        await ctx.db.execute(query, ctx.guild.id)
+        await ctx.send('Live game updates are no longer posted in this server.')
+        self.refresh_watchlist.restart()
+
+    @league.command(name="add")
+    async def add(self, ctx, region: str, *, name: str):
+        """Link a league of legends summoner to your discord account."""
+        try:
+            region = riot.verify_region(region)
+        except RegionException as err:
+            await ctx.send(str(err))
+            return
+        message = await ctx.send(embed=self.waiting_embed)
+        try:
+            summoner = await riot.fetch_summoner(name, region)
+        except Exception as err:
+            print(str(err))
+            await message.edit(content='No summoner with that name found.', embed=None)
+            return
+
+        query = "SELECT 1 FROM summoner WHERE account_id=$1 AND summoner_id=$2 AND region=$3;"
+        if await ctx.db.fetchrow(query, str(ctx.author.id), summoner.id, region):
+            await message.edit(content=f'{summoner.name} is already linked to your account.', embed=None)
+            return
+
+        try:
+            await Summoner.insert(ctx.db, summoner_id=summoner.id, region=region, account_id=str(ctx.author.id),
+                                  puuid=summoner.puuid, name=summoner.name)
+        except Exception as e:
+            print(e)
+            await message.edit(content='Could not link account.', embed=None)
+            return
+
+        try:
+            await self.snapshot_ranks(summoner.id, region, summoner.puuid, summoner.name)
+        except Exception as e:
+            # the refresh loop will pick it up later on
+            log.warning('Could not snapshot ranks of %s: %s', summoner.id, e)
+
+        embed = FooterEmbed(self.bot, title='Succes!',
+                            description=f'{summoner.name} is now linked to your account with region {region.upper()}.')
+        embed.set_author(
+            name=f'{summoner.name}', icon_url=f'http://ddragon.leagueoflegends.com/cdn/{VERSION}/img/profileicon/{summoner.profile_icon_id}.png')
+        await message.edit(embed=embed)
+
+    @league.command(name="remove")
+    async def remove(self, ctx, region: str, *, name: str):
+        """Unlink a league of legends summoner from your discord account."""
+        try:
+            region = riot.verify_region(region)
+        except RegionException as err:
+            await ctx.send(str(err))
+            return
+        query = "DELETE FROM summoner WHERE account_id=$1 AND region=$2 AND lower(name)=lower($3);"
+        status = await ctx.db.execute(query, str(ctx.author.id), region, name)
+        if status == 'DELETE 0':
+            await ctx.send(f'{name} is not linked to your account.')
+        else:
+            await ctx.send(f'{name} is no longer linked to your account.')
+
+    @league.command(name="leaderboard")
+    @commands.guild_only()
+    async def leaderboard(self, ctx):
+        """Solo/duo ranks of everyone in the server with a linked account"""
+        query = """SELECT s.account_id, r.name, r.region, r.tier, r.division, r.lp, r.wins, r.losses
+                   FROM summoner s
+                   INNER JOIN summoner_ranks r ON r.puuid = s.puuid
+                   WHERE s.account_id = ANY($1::text[])
+                   AND r.score IS NOT NULL
+                   ORDER BY r.score DESC;
+                """
+        member_ids = [str(m.id) for m in ctx.guild.members]
+        records = await ctx.db.fetch(query, member_ids)
+        if not records:
+            await ctx.send('Nobody in this server has a ranked account linked. Use `league add` to link one.')
+            return
+
+        entries = []
+        for index, record in enumerate(records):
+            medal = MEDALS[index] if index < len(MEDALS) else ''
+            tier = record['tier'].capitalize()
+            division = '' if record['tier'] in riot.APEX_TIERS else f' {record["division"]}'
+            games = record['wins'] + record['losses']
+            winrate = math.ceil(record['wins'] / games * 100) if games else 0
+            entries.append(
+                f'{medal} <@{record["account_id"]}> **{record["name"]}** ({record["region"].upper()}) '
+                f'{tier}{division} {record["lp"]} LP - {winrate}% {games}G'.strip())
+
+        pages = SimplePages(entries, ctx=ctx, per_page=10)
+        pages.embed.title = f'{ctx.guild.name} leaderboard'
+        pages.embed.colour = self.bot.color
+        await pages.start()
+
+    @league.command(name="graph")
+    async def graph(self, ctx, region: str, *, name: str):
+        """Solo/duo LP graph of a linked summoner over the last 30 days"""
+        try:
+            region = riot.verify_region(region)
+        except RegionException as err:
+            await ctx.send(str(err))
+            return
+        try:
+            summoner = await riot.fetch_summoner(name, region)
+        except Exception as err:
+            print(str(err))
+            await ctx.send('No summoner with that name found.')
+            return
+
+        end = datetime.utcnow()
+        start = end - timedelta(days=LP_GRAPH_DAYS)
+        # the last point before the window is the starting value of the graph
+        query = """(SELECT recorded, score FROM lp_history
+                    WHERE puuid=$1 AND recorded <= $2
+                    ORDER BY recorded DESC
+                    LIMIT 1)
+                   UNION ALL
+                   (SELECT recorded, score FROM lp_history
+                    WHERE puuid=$1 AND recorded > $2
+                    ORDER BY recorded);
+                """
+        records = await ctx.db.fetch(query, summoner.puuid, start)
+        if not records:
+            await ctx.send(f'No LP history for {summoner.name}. Only summoners linked with `league add` are tracked.')
+            return
+
+        points = [(max(record['recorded'], start), record['score']) for record in records]
+        values = _resample(points, start, end, LP_GRAPH_WIDTH)
+        chart = formats.text_chart(values, label=riot.score_label)
+        embed = FooterEmbed(self.bot, title=f'{summoner.name} LP over the last {LP_GRAPH_DAYS} days',
+                            description=f'```\n{chart}\n```')
+        embed.add_field(name='Current', value=riot.score_label(values[-1]))
+        embed.add_field(name='Peak', value=riot.score_label(max(values)))
+        embed.add_field(name='Change', value=f'{values[-1] - values[0]:+} LP')
+        await ctx.send(embed=embed)
+
+    async def store_matches(self, puuid: str, region: str, match_ids: List[str]) -> None:
+        """Fetches and stores the summaries of the matches we don't have yet."""
+        query = "SELECT match_id FROM match_summaries WHERE puuid=$1 AND match_id = ANY($2::text[]);"
+        known = {r['match_id'] for r in await self.bot.pool.fetch(query, puuid, match_ids)}
+        missing = [match_id for match_id in match_ids if match_id not in known]
+        if not missing:
+            return
+
+        matches = await asyncio.gather(*(riot.fetch_match(match_id, region) for match_id in missing),
+                                       return_exceptions=True)
+        rows = []
+        for match_id, match in zip(missing, matches):
+            if isinstance(match, Exception):
+                log.info('Could not fetch match %s: %s', match_id, match)
+                continue
+            row = summarise(match, puuid)
+            if row is not None:
+                rows.append(row)
+
+        if rows:
+            # another invocation might have stored some of them in the meantime
+            await MatchSummaries.upsert_many(rows, columns=MATCH_COLUMNS, update=(), connection=self.bot.pool)
+
+    @league.command(name="champs")
+    async def champs(self, ctx, region: str, *, name: str):
+        """Winrate, KDA, CS and damage share per champion over the last 100 games"""
+        message = await ctx.send(embed=self.waiting_embed)
+        try:
+            region = riot.verify_region(region)
+        except RegionException as err:
+            await message.edit(content=str(err), embed=None)
+            return
+        try:
+            summoner = await riot.fetch_summoner(name, region)
+            match_ids = await riot.fetch_match_ids(summoner.puuid, region, count=CHAMPS_MATCHES)
+        except Exception as err:
+            print(str(err))
+            await message.edit(content='No summoner with that name found.', embed=None)
+            return
+
+        await self.store_matches(summoner.puuid, region, match_ids)
+        query = """SELECT champion, role, win, kills, deaths, assists, cs, duration, damage, team_damage
+                   FROM match_summaries
+                   WHERE puuid=$1
+                   ORDER BY played DESC
+                   LIMIT $2;
+                """
+        records = await ctx.db.fetch(query, summoner.puuid, CHAMPS_MATCHES)
+        frame = MatchFrame(records)
+        if not len(frame):
+            await message.edit(content=f'No games found for {summoner.name}.', embed=None)
+            return
+
+        def table(aggregates):
+            table = TabularData()
+            table.set_columns(['', 'G', 'WR', 'KDA', 'CS/m', 'DMG'])
+            table.add_rows(
+                [a.key.capitalize(), a.games, f'{a.winrate:.0%}', f'{a.kda:.2f}', f'{a.cs_per_min:.1f}', f'{a.damage_share:.0%}']
+                for a in aggregates
+            )
+            return f'```\n{table.render()}\n```'
+
+        overall = frame.overall()
+        embed = FooterEmbed(self.bot, title=f'{summoner.name} - last {len(frame)} games',
+                            description=f'{overall.winrate:.0%} WR, {overall.kda:.2f} KDA, '
+                                        f'{overall.cs_per_min:.1f} CS/min, {overall.damage_share:.0%} damage share')
+        embed.add_field(name='Champions', value=table(frame.by_champion()[:CHAMPS_SHOWN]), inline=False)
+        embed.add_field(name='Roles', value=table(frame.by_role()), inline=False)
+        await message.edit(embed=embed)
 
     @league.command(name="history")
     async def history(self, ctx, region: str, *, name: str):
@@ -162,6 +722,36 @@ class League(commands.Cog):
 
         await message.edit(embed=embed)
 
+    @league.command(name="multi")
+    async def multi(self, ctx, region: str, *, lobby: str):
+        """Ranks of everyone in a pasted champ select lobby"""
+        try:
+            region = riot.verify_region(region)
+        except RegionException as err:
+            await ctx.send(str(err))
+            return
+        names = riot.parse_lobby(lobby)
+        if not names:
+            await ctx.send('Could not find any summoner names in that lobby.')
+            return
+
+        message = await ctx.send(embed=self.waiting_embed)
+        results = await riot.get_lobby_ranks(names, region)
+
+        table = TabularData()
+        table.set_columns(['Summoner', 'Solo/duo', 'LP', 'WR', 'Flex'])
+        for name, summoner, ranks in results:
+            if summoner is None:
+                table.add_row([name, 'Not found', '-', '-', '-'])
+                continue
+            solo_rank, _, flex_rank, _, solo_LP, _, _, solo_winrate_compact = ranks
+            table.add_row([summoner.name, solo_rank.strip(), solo_LP,
+                           solo_winrate_compact or '-', flex_rank.strip()])
+
+        embed = FooterEmbed(self.bot, title=f'Lobby ({region.upper()})',
+                            description=f'```\n{table.render()}\n```')
+        await message.edit(embed=embed)
+
 
 async def setup(bot):
     cog = League(bot)
@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import logging
+from typing import TYPE_CHECKING, Any, Iterable, List, Optional, Tuple
+
+from aiohttp import web
+from discord.ext import commands
+
+from .utils import db, histogram, riot
+from .utils.exposition import CONTENT_TYPE, BoundedLabel, Exposition
+from .utils.loopmonitor import LAG_BUCKETS
+
+if TYPE_CHECKING:
+    from bot import Netero
+    from .utils.histogram import LatencyHistogram
+
+
+log = logging.getLogger(__name__)
+
+# upper bounds on how many values a label can take, anything new past them is
+# folded into an "other" series so a flood of new values can't grow the output
+MAX_COMMANDS = 200
+MAX_EVENTS = 100
+# the latency histograms have 64 buckets, export every 4th bound (x2.44 apart)
+LATENCY_STEP = 4
+
+
+def _latency_buckets(h: LatencyHistogram) -> List[Tuple[float, int]]:
+    buckets = []
+    for start in range(0, histogram.BUCKETS, LATENCY_STEP):
+        end = min(start + LATENCY_STEP, histogram.BUCKETS)
+        bound = histogram.upper_bound(end - 1) / 1000.0
+        buckets.append((bound, sum(h.counts[start:end])))
+    # the last bucket is open ended
+    buckets[-1] = (float('inf'), buckets[-1][1])
+    return buckets
+
+
+class Metrics(commands.Cog):
+    """Serves the bot's internal counters in the Prometheus text format."""
+
+    def __init__(self, bot: Netero) -> None:
+        self.bot: Netero = bot
+        self.runner: Optional[web.AppRunner] = None
+        self.command_labels = BoundedLabel(MAX_COMMANDS)
+        self.latency_labels = BoundedLabel(MAX_COMMANDS)
+        self.event_labels = BoundedLabel(MAX_EVENTS)
+        self.event_size_labels = BoundedLabel(MAX_EVENTS)
+
+    async def cog_load(self) -> None:
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle_metrics)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        # only meant for a scraper on the same host, bind elsewhere through the config
+        host = getattr(self.bot.config, 'metrics_host', '127.0.0.1')
+        port = getattr(self.bot.config, 'metrics_port', 9400)
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        log.info('Serving metrics on http://%s:%s/metrics', host, port)
+
+    async def cog_unload(self) -> None:
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        body = self.render()
+        return web.Response(body=body.encode('utf-8'), headers={'Content-Type': CONTENT_TYPE})
+
+    def render(self) -> str:
+        out = Exposition('netero_')
+        self.collect_commands(out)
+        self.collect_database(out)
+        self.collect_riot(out)
+        self.collect_queues(out)
+        self.collect_gateway(out)
+        self.collect_loop(out)
+        return out.render()
+
+    def collect_commands(self, out: Exposition) -> None:
+        command_stats = getattr(self.bot, 'command_stats', {})
+        counts = self.command_labels.fold(command_stats.items())
+        out.metric('commands_total', 'counter', 'Commands invoked this session.',
+                   (({'command': name}, count) for name, count in counts))
+
+        latency: dict[str, Any] = getattr(self.bot, 'command_latency', {})
+        series = []
+        other: Optional[LatencyHistogram] = None
+        for name, h in sorted(latency.items(), key=lambda t: t[1].count, reverse=True):
+            if self.latency_labels.admit(name):
+                series.append(({'command': name}, _latency_buckets(h), h.total))
+            else:
+                if other is None:
+                    other = histogram.LatencyHistogram()
+                other.merge(h)
+        if other is not None:
+            series.append(({'command': 'other'}, _latency_buckets(other), other.total))
+        out.histogram('command_duration_seconds', 'Time spent in command callbacks.', series)
+
+        counters = getattr(self.bot, 'counters', None)
+        if counters is not None:
+            out.metric('guilds', 'gauge', 'Guilds the bot is in.', [(None, counters.guilds)])
+            out.metric('members', 'gauge', 'Cached guild members.', [(None, counters.members)])
+            out.metric('channels', 'gauge', 'Guild channels by type.', [
+                ({'type': 'text'}, counters.text_channels),
+                ({'type': 'voice'}, counters.voice_channels),
+            ])
+
+    def collect_database(self, out: Exposition) -> None:
+        pool = getattr(self.bot, 'pool', None)
+        if pool is None:
+            return
+
+        size = pool.get_size()
+        idle = pool.get_idle_size()
+        out.metric('db_pool_connections', 'gauge', 'Connections in the asyncpg pool.', [
+            ({'state': 'busy'}, size - idle),
+            ({'state': 'idle'}, idle),
+        ])
+        out.metric('db_pool_max_connections', 'gauge', 'Maximum size of the asyncpg pool.', [(None, pool.get_max_size())])
+        out.histogram('db_pool_acquire_seconds', 'Time spent waiting for a pool connection.',
+                      [(None, _latency_buckets(pool.wait), pool.wait.total)])
+        out.metric('db_pool_acquire_timeouts_total', 'counter', 'Pool acquires that timed out.', [(None, pool.timeouts)])
+        out.metric('db_pool_leaked_connections', 'gauge', 'Connections held past the leak threshold.',
+                   [(None, len(pool.leaks()))])
+        # holders are the registered command names plus "background"
+        out.histogram('db_pool_hold_seconds', 'How long pool connections were held.',
+                      (({'holder': label}, _latency_buckets(h), h.total) for label, h in pool.held.items()))
+
+        # registered queries are declared in code, so the label can't grow on its own
+        queries = db.Table.all_queries()
+        out.metric('db_query_calls_total', 'counter', 'Runs of the registered queries.',
+                   (({'query': q.name}, q.calls) for q in queries))
+        out.metric('db_query_seconds_total', 'counter', 'Time spent in the registered queries.',
+                   (({'query': q.name}, q.total) for q in queries))
+
+    def collect_riot(self, out: Exposition) -> None:
+        caches = (('summoner', riot.summoner_cache), ('league', riot.league_cache))
+        # the bot's own ExpiringCaches in front of the scheduler, not pyot's pipeline cache
+        out.metric('riot_lookup_cache_requests_total', 'counter', 'Lookups in the summoner and league caches.', [
+            sample
+            for name, cache in caches
+            for sample in (({'cache': name, 'result': 'hit'}, cache.hits), ({'cache': name, 'result': 'miss'}, cache.misses))
+        ])
+        out.metric('riot_lookup_cache_entries', 'gauge', 'Entries in the summoner and league caches.',
+                   (({'cache': name}, len(cache)) for name, cache in caches))
+
+        scheduler = riot.scheduler
+        out.metric('riot_requests_total', 'counter', 'Riot API requests made.', [(None, scheduler.requests)])
+        out.metric('riot_rate_wait_seconds_total', 'counter', 'Time spent waiting on the rate limiter.',
+                   [(None, scheduler.waited)])
+        # routing values are the fixed set of Riot platforms and regions
+        out.metric('riot_requests_in_flight', 'gauge', 'Riot API requests in flight per routing value.',
+                   (({'routing': routing}, scheduler.pending(routing)) for routing in scheduler.routings))
+
+    def collect_queues(self, out: Exposition) -> None:
+        samples: List[Tuple[Any, float]] = []
+        stats = self.bot.get_cog('Stats')
+        if stats is not None:
+            samples.extend(({'queue': name}, depth) for name, depth in stats.queue_depths().items())
+            out.metric('command_spool_bytes', 'gauge', 'Command stats spooled to disk and not replayed yet.',
+                       [(None, stats.spool.size())])
+
+        league = self.bot.get_cog('League')
+        if league is not None:
+            samples.append(({'queue': 'watched_players'}, len(league.watch)))
+            out.metric('watch_interval_scale', 'gauge', 'How much the live game poll intervals are stretched.',
+                       [(None, league.watch.scale)])
+
+        out.metric('queue_depth', 'gauge', 'Items waiting in internal queues.', samples)
+
+    def collect_gateway(self, out: Exposition) -> None:
+        stats = getattr(self.bot, 'gateway_stats', None)
+        if stats is None:
+            return
+
+        def totals(labels: BoundedLabel, counters: Iterable[Tuple[str, Any]]) -> List[Tuple[str, float]]:
+            return labels.fold((key, counter.total) for key, counter in counters)
+
+        out.metric('gateway_events_total', 'counter', 'Gateway events received by type.',
+                   (({'event': event}, count) for event, count in totals(self.event_labels, stats.events.items())))
+        out.metric('gateway_received_bytes_total', 'counter', 'Gateway payload size received by event type.',
+                   (({'event': event}, size) for event, size in totals(self.event_size_labels, stats.bytes.items())))
+        out.metric('gateway_shard_events_total', 'counter', 'Gateway events received by shard.',
+                   (({'shard': shard_id}, counter.total) for shard_id, counter in sorted(stats.shards.items())))
+
+    def collect_loop(self, out: Exposition) -> None:
+        stats = self.bot.get_cog('Stats')
+        if stats is None:
+            return
+
+        monitor = stats.loop_monitor
+        buckets = [(bound / 1000.0, count) for bound, count in zip(LAG_BUCKETS, monitor.counts)]
+        out.histogram('event_loop_lag_seconds', 'How late the event loop woke up from a sleep.',
+                      [(None, buckets, monitor.total_lag)])
+        out.metric('event_loop_stalls', 'gauge', 'Stalls captured by the loop watchdog, most recent ones.',
+                   [(None, len(monitor.stalls))])
+
+
+async def setup(bot: Netero) -> None:
+    await bot.add_cog(Metrics(bot))
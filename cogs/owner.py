@@ -17,7 +17,9 @@ import subprocess
 import config
 from discord.ext.commands.converter import Greedy
 from discord.object import Object
+from .utils import db
 from .utils.context import Context
+from .utils.formats import TabularData
 from typing import Literal, Union, Optional
 from .utils.datadownloader import VERSION
 # to expose to the eval command
@@ -46,6 +48,23 @@ class GlobalChannel(commands.Converter):
                 return channel
 
 
+def _convert_parameter(type_name: str, argument: str):
+    # turns a command argument into what asyncpg expects for a parameter type
+    if type_name.startswith('_'):
+        return [_convert_parameter(type_name[1:], part) for part in argument.split(',') if part]
+    if type_name in ('int2', 'int4', 'int8'):
+        return int(argument)
+    if type_name in ('float4', 'float8'):
+        return float(argument)
+    if type_name == 'bool':
+        return argument.lower() in ('true', 't', 'yes', '1')
+    if type_name in ('timestamp', 'timestamptz'):
+        return datetime.datetime.fromisoformat(argument)
+    if type_name == 'date':
+        return datetime.date.fromisoformat(argument)
+    return argument
+
+
 class Owner(commands.Cog):
     """Default owner commands."""
 
@@ -220,6 +239,42 @@ class Owner(commands.Cog):
         for i in range(times):
             await new_ctx.reinvoke()
 
+    @commands.group(name='queries', hidden=True, invoke_without_command=True)
+    async def _queries(self, ctx):
+        """Shows how often and how long the registered queries ran."""
+        table = TabularData()
+        table.set_columns(['Query', 'Calls', 'Avg', 'Max', 'Total'])
+        for query in sorted(db.Table.all_queries(), key=lambda q: q.total, reverse=True):
+            average = query.total / query.calls if query.calls else 0.0
+            table.add_row([query.name, query.calls, f'{average * 1000:.2f}ms', f'{query.max * 1000:.2f}ms',
+                           f'{query.total:.2f}s'])
+        await ctx.send(f'```\n{table.render()}\n```')
+
+    @_queries.command(name='explain', hidden=True)
+    async def _queries_explain(self, ctx: Context, name: str, *args: str):
+        """Runs a registered query under EXPLAIN (ANALYZE, BUFFERS) and rolls it back."""
+        query = db.Table.get_query(name)
+        if query is None:
+            return await ctx.send(f'There is no query named {name}.')
+
+        async with ctx.acquire():
+            types = await query.parameters(ctx.db)
+            if len(args) != len(types):
+                return await ctx.send(f'{name} takes {len(types)} arguments: {", ".join(types) or "none"}.')
+
+            try:
+                arguments = [_convert_parameter(t, argument) for t, argument in zip(types, args)]
+            except ValueError as e:
+                return await ctx.send(f'Bad argument: {e}')
+
+            plan = await query.explain(ctx.db, *arguments)
+
+        if len(plan) > 1980:
+            fp = io.BytesIO(plan.encode('utf-8'))
+            await ctx.send('Too long to show here, attached as a file.', file=discord.File(fp, 'plan.txt'))
+        else:
+            await ctx.send(f'```\n{plan}\n```')
+
     @commands.command(hidden=True)
     async def get_app_commands(self, ctx):
         print(await self.bot.tree.fetch_commands())
@@ -1,27 +1,39 @@
 from __future__ import annotations
 import asyncio
 from collections import Counter
+import os
 import re
+import tempfile
 import textwrap
 import traceback
-from typing import TYPE_CHECKING, Any, Optional, TypedDict
+from typing import TYPE_CHECKING, Any, NamedTuple, Optional
 from typing_extensions import Annotated
 
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 
 import asyncpg
 import discord
 from discord.ext import commands, tasks, menus
 
 # system information
-import platform
-import cpuinfo
 import psutil
 import logging
 
 # utils
-from .utils import time, db
+from .utils import time, db, reports
+from .utils.cache import ExpiringCache
+from .utils.counters import BotCounters
+from .utils.db import UNREACHABLE
+from .utils.fingerprint import ErrorGroup, ErrorTracker
+from .utils.formats import TabularData
+from .utils.histogram import LatencyHistogram
+from .utils.rates import GatewayStats
+from .utils.loopmonitor import LAG_BUCKETS, LoopMonitor, Stall
+from .utils.pool import BACKGROUND, pool_label
+from .utils.sampler import SystemSampler
+from .utils.spool import Spool
 from .utils.embed import FooterEmbed
+from .utils.export import export_query, human_size
 
 if TYPE_CHECKING:
     from .utils.context import Context
@@ -30,16 +42,62 @@ if TYPE_CHECKING:
 log = logging.getLogger(__name__)
 
 
-class DataBatchEntry(TypedDict):
-    guild: Optional[int]
-    channel: int
-    author: int
-    used: str
+# the ingestion buffer is flushed every BATCH_INTERVAL seconds, or earlier
+# once BATCH_FLUSH_SIZE commands are pending. Batches that can't reach the
+# database, and any backlog past BATCH_MAX_SIZE, are written to a spool file
+# on disk instead and replayed SPOOL_CHUNK rows at a time once it's back.
+# Batches the database rejects outright go to a separate .rejected file.
+BATCH_INTERVAL = 10.0
+BATCH_FLUSH_SIZE = 500
+BATCH_MAX_SIZE = 50_000
+SPOOL_PATH = 'command_spool.jsonl'
+SPOOL_CHUNK = 5_000
+SPOOL_CHUNKS_PER_FLUSH = 10
+
+# gateway log records are collected for GATEWAY_WINDOW seconds after the
+# first one arrives and sent as a single webhook message, split into pages
+# of GATEWAY_PAGE_SIZE characters. At most GATEWAY_MAX_PAGES go out per
+# window and the queue holds GATEWAY_QUEUE_SIZE records, everything past
+# that is only counted and summarised at the end of the next message.
+GATEWAY_WINDOW = 5.0
+GATEWAY_QUEUE_SIZE = 200
+GATEWAY_PAGE_SIZE = 1900
+GATEWAY_MAX_PAGES = 3
+
+# the first occurrence of an error is posted with its traceback, repeats are
+# summarised every ERROR_SUMMARY_INTERVAL seconds
+ERROR_SUMMARY_INTERVAL = 600.0
+
+# hourly rollups older than COMPACT_AFTER_DAYS are folded into one row per
+# day, COMPACT_BATCH rows at a time so no statement holds its locks for long
+COMPACT_AFTER_DAYS = 30
+COMPACT_BATCH = 5_000
+
+# usage reports are cached for REPORT_TTL seconds, a flush that touches a
+# guild drops its reports right away
+REPORT_TTL = 60.0
+
+
+class DataBatchEntry(NamedTuple):
+    # fields are named and ordered after the commands columns, for COPY
+    guild_id: Optional[int]
+    channel_id: int
+    author_id: int
+    used: datetime
     prefix: str
     command: str
     failed: bool
 
 
+def _encode_entry(entry: DataBatchEntry) -> list[Any]:
+    return [*entry[:3], entry.used.isoformat(), *entry[4:]]
+
+
+def _decode_entry(data: list[Any]) -> DataBatchEntry:
+    guild_id, channel_id, author_id, used, prefix, command, failed = data
+    return DataBatchEntry(guild_id, channel_id, author_id, datetime.fromisoformat(used), prefix, command, failed)
+
+
 class GatewayHandler(logging.Handler):
     def __init__(self, cog: Stats):
         self.cog: Stats = cog
@@ -52,16 +110,114 @@ class GatewayHandler(logging.Handler):
         self.cog.add_record(record)
 
 
-class Commands(db.Table):
+def _compact_query(table: str, keys: str, totals: tuple[str, ...]) -> str:
+    # The hourly rows of a day are moved into its midnight bucket, which
+    # doubles as the day row, so a moved row is never the one upserted into.
+    columns = ', '.join(totals)
+    sums = ', '.join(f'SUM({total})' for total in totals)
+    updates = ', '.join(f'{total} = t.{total} + EXCLUDED.{total}' for total in totals)
+    return f"""WITH moved AS (
+                   DELETE FROM {table}
+                   WHERE ctid IN (
+                       SELECT ctid FROM {table}
+                       WHERE bucket >= $1 AND bucket < $2 AND bucket <> date_trunc('day', bucket)
+                       LIMIT $3
+                   )
+                   RETURNING *
+               )
+               INSERT INTO {table} AS t ({keys}, bucket, {columns})
+               SELECT {keys}, date_trunc('day', bucket), {sums}
+               FROM moved
+               GROUP BY {keys}, date_trunc('day', bucket)
+               ON CONFLICT ({keys}, bucket) DO UPDATE SET {updates};
+            """
+
+
+class Commands(db.Table, partition_by='used'):
     id = db.PrimaryKeyColumn()
 
-    guild_id = db.Column(db.Integer(big=True), index=True)
+    guild_id = db.Column(db.Integer(big=True))
     channel_id = db.Column(db.Integer(big=True))
-    author_id = db.Column(db.Integer(big=True), index=True)
+    author_id = db.Column(db.Integer(big=True))
     used = db.Column(db.Datetime, index=True)
     prefix = db.Column(db.String)
     command = db.Column(db.String, index=True)
-    failed = db.Column(db.Boolean, index=True)
+    failed = db.Column(db.Boolean)
+
+    # guild_id=$1 AND used > ... and guild_id=$1 AND author_id=$2 are the hot
+    # predicates, these replace the single column guild_id/author_id indexes
+    guild_used = db.Index('guild_id', 'used', include=['command'])
+    guild_author = db.Index('guild_id', 'author_id', 'used', include=['command'])
+    # failures are rare, so only index those rows
+    failures = db.Index('used', include=['command'], where='failed')
+
+
+class CommandsHourly(db.Table, table_name='commands_hourly'):
+    # Rollups of the commands table, maintained by Stats.bulk_insert.
+    # guild_id is part of the key so private messages are stored as 0.
+    # Past COMPACT_AFTER_DAYS the buckets are whole days, see Stats.compact_rollups.
+    guild_id = db.Column(db.Integer(big=True), primary_key=True)
+    command = db.Column(db.String, primary_key=True)
+    bucket = db.Column(db.Datetime, primary_key=True, index=True)
+    uses = db.Column(db.Integer, nullable=False)
+    failures = db.Column(db.Integer, nullable=False)
+
+    guild_report = db.Query(reports.GUILD)
+    global_report = db.Query(reports.GLOBAL)
+    today_report = db.Query(reports.TODAY)
+    add_batch = db.Query("""INSERT INTO commands_hourly AS h (guild_id, command, bucket, uses, failures)
+                            SELECT * FROM unnest($1::bigint[], $2::text[], $3::timestamp[], $4::int[], $5::int[])
+                            ON CONFLICT (guild_id, command, bucket) DO UPDATE
+                            SET uses = h.uses + EXCLUDED.uses, failures = h.failures + EXCLUDED.failures;
+                         """)
+    compact = db.Query(_compact_query('commands_hourly', 'guild_id, command', ('uses', 'failures')), slow=5.0)
+
+
+class CommandAuthorsHourly(db.Table, table_name='command_authors_hourly'):
+    guild_id = db.Column(db.Integer(big=True), primary_key=True)
+    author_id = db.Column(db.Integer(big=True), primary_key=True)
+    command = db.Column(db.String, primary_key=True)
+    bucket = db.Column(db.Datetime, primary_key=True, index=True)
+    uses = db.Column(db.Integer, nullable=False)
+
+    member_report = db.Query(reports.MEMBER)
+    add_batch = db.Query("""INSERT INTO command_authors_hourly AS a (guild_id, author_id, command, bucket, uses)
+                            SELECT * FROM unnest($1::bigint[], $2::bigint[], $3::text[], $4::timestamp[], $5::int[])
+                            ON CONFLICT (guild_id, author_id, command, bucket) DO UPDATE
+                            SET uses = a.uses + EXCLUDED.uses;
+                         """)
+    compact = db.Query(_compact_query('command_authors_hourly', 'guild_id, author_id, command', ('uses',)), slow=5.0)
+
+
+class CommandLatency(db.Table, table_name='command_latency'):
+    # log-bucketed duration histograms per command and hour, see utils.histogram
+    command = db.Column(db.String, primary_key=True)
+    bucket = db.Column(db.Datetime, primary_key=True, index=True)
+    counts = db.Column(db.Array(db.Integer), nullable=False)
+
+    add = db.Query("""INSERT INTO command_latency AS l (command, bucket, counts)
+                      VALUES ($1, $2, $3)
+                      ON CONFLICT (command, bucket) DO UPDATE
+                      SET counts = ARRAY(SELECT a + b FROM unnest(l.counts, EXCLUDED.counts) WITH ORDINALITY AS t(a, b, i) ORDER BY i);
+                   """)
+
+
+class CommandErrors(db.Table, table_name='command_errors'):
+    # history of Stats.errors, only written to when error_history is set in the config
+    fingerprint = db.Column(db.String, primary_key=True)
+    exc_type = db.Column(db.String, nullable=False)
+    message = db.Column(db.String)
+    first_seen = db.Column(db.Datetime, nullable=False)
+    last_seen = db.Column(db.Datetime, nullable=False, index=True)
+    occurrences = db.Column(db.Integer, nullable=False)
+
+    save = db.Query("""INSERT INTO command_errors AS e (fingerprint, exc_type, message, first_seen, last_seen, occurrences)
+                       VALUES ($1, $2, $3, $4, $5, $6)
+                       ON CONFLICT (fingerprint) DO UPDATE
+                       SET message = EXCLUDED.message,
+                           last_seen = EXCLUDED.last_seen,
+                           occurrences = e.occurrences + EXCLUDED.occurrences;
+                    """)
 
 
 _INVITE_REGEX = re.compile(
@@ -78,52 +234,233 @@ class Stats(commands.Cog):
     def __init__(self, bot: commands.Bot) -> None:
         self.bot: commands.Bot = bot
         self.process = psutil.Process()
+        self.sampler = SystemSampler(self.process)
+        self.sample_system.start()
+        self.loop_monitor = LoopMonitor(threshold=getattr(bot.config, 'loop_lag_threshold', 0.25),
+                                        on_stall=self.report_stall)
+        self.loop_monitor.start()
+        self._last_stall_report = 0.0
+        # latency recorded since the last flush, keyed by (command, hour)
+        self._latency_delta: dict[tuple[str, datetime], LatencyHistogram] = {}
+        self.latency_flush.add_exception_type(*UNREACHABLE)
+        self.latency_flush.start()
+        # only guards flushes, registering a command never waits on it
         self._batch_lock = asyncio.Lock()
         self._data_batch: list[DataBatchEntry] = []
-        self.bulk_insert_loop.add_exception_type(
-            asyncpg.PostgresConnectionError)
+        self._flush_requested = asyncio.Event()
+        self._batch_stats: Counter[str] = Counter()
+        self._batch_peak = 0
+        self._last_flush = 0.0
+        path = getattr(bot.config, 'command_spool', SPOOL_PATH)
+        self.spool = Spool(path, encode=_encode_entry, decode=_decode_entry)
+        # batches the database refused, never replayed automatically
+        self.rejected = Spool(f'{path}.rejected', encode=_encode_entry, decode=_decode_entry)
+        self.bulk_insert_loop.add_exception_type(*UNREACHABLE)
         self.bulk_insert_loop.start()
-        self._gateway_queue = asyncio.Queue()
+        self.partition_maintenance.add_exception_type(*UNREACHABLE)
+        self.partition_maintenance.start()
+        # days before this are known to be compacted already
+        self._compacted_until: Optional[datetime] = None
+        self.rollup_compaction.start()
+        self._gateway_queue: asyncio.Queue[logging.LogRecord] = asyncio.Queue(maxsize=GATEWAY_QUEUE_SIZE)
+        # records that didn't make it into a message, by level name
+        self._gateway_dropped: Counter[str] = Counter()
         self.gateway_worker.start()
+        self.errors = ErrorTracker()
+        # keyed by (guild_id, member_id, query name), guild_id is None for the global ones
+        self._report_cache: ExpiringCache[tuple[Optional[int], Optional[int], str], reports.UsageReport] = ExpiringCache(
+            REPORT_TTL, maxsize=512)
+        # bumped on every invalidation, so a report fetched across one isn't cached
+        self._report_epoch = 0
+        self.error_summary.start()
+        self.pool_watch.start()
 
     def get_bot_uptime(self, *, brief=False):
         return time.human_timedelta(self.bot.uptime, accuracy=None, brief=brief, suffix=False)
 
     def cog_unload(self):
         self.bulk_insert_loop.stop()
+        self.partition_maintenance.cancel()
+        self.rollup_compaction.cancel()
+        self.sample_system.cancel()
+        self.loop_monitor.stop()
+        self.latency_flush.stop()
         self.gateway_worker.cancel()
+        self.error_summary.cancel()
+        self.pool_watch.cancel()
+
+    def queue_depths(self) -> dict[str, int]:
+        """How many items are waiting in the ingestion queues, by queue."""
+        return {
+            'command_batch': len(self._data_batch),
+            'gateway_log': self._gateway_queue.qsize(),
+        }
 
     def add_record(self, record: logging.LogRecord) -> None:
-        self._gateway_queue.put_nowait(record)
+        try:
+            self._gateway_queue.put_nowait(record)
+        except asyncio.QueueFull:
+            self._gateway_dropped[record.levelname] += 1
 
     def censor_object(self, obj: str | discord.abc.Snowflake) -> str:
         if not isinstance(obj, str) and obj.id in self.bot.blacklist:
             return '[censored]'
         return censor_invite(obj)
 
-    async def notify_gateway_status(self, record: logging.LogRecord) -> None:
+    def format_gateway_record(self, record: logging.LogRecord) -> str:
         attributes = {'INFO': '\N{INFORMATION SOURCE}',
                       'WARNING': '\N{WARNING SIGN}'}
 
         emoji = attributes.get(record.levelname, '\N{CROSS MARK}')
         dt = datetime.utcfromtimestamp(record.created)
-        msg = textwrap.shorten(
-            f'{emoji} [{time.format_dt(dt)}] `{record.message}`', width=1990)
-        await self.webhook.send(msg, username='Gateway', avatar_url='https://i.imgur.com/4PnCKB3.png')
-
-    async def bulk_insert(self) -> None:
-        query = """INSERT INTO commands (guild_id, channel_id, author_id, used, prefix, command, failed)
-                   SELECT x.guild, x.channel, x.author, x.used, x.prefix, x.command, x.failed
-                   FROM jsonb_to_recordset($1::jsonb) AS
-                   x(guild BIGINT, channel BIGINT, author BIGINT, used TIMESTAMP, prefix TEXT, command TEXT, failed BOOLEAN)
-                """
+        return textwrap.shorten(
+            f'{emoji} [{time.format_dt(dt)}] `{record.message}`', width=GATEWAY_PAGE_SIZE)
+
+    async def notify_gateway_status(self, records: list[logging.LogRecord]) -> None:
+        omitted, self._gateway_dropped = self._gateway_dropped, Counter()
+        pages: list[str] = []
+        page = ''
+        for record in records:
+            if len(pages) == GATEWAY_MAX_PAGES:
+                omitted[record.levelname] += 1
+                continue
+
+            line = self.format_gateway_record(record)
+            if page and len(page) + len(line) + 1 > GATEWAY_PAGE_SIZE:
+                pages.append(page)
+                page = ''
+                if len(pages) == GATEWAY_MAX_PAGES:
+                    omitted[record.levelname] += 1
+                    continue
+            page = f'{page}\n{line}' if page else line
+
+        if page:
+            pages.append(page)
+
+        if omitted:
+            levels = ', '.join(f'{count} {level.lower()}' for level, count in omitted.most_common())
+            summary = f'\N{HORIZONTAL ELLIPSIS} {sum(omitted.values())} more records omitted ({levels})'
+            if pages:
+                pages[-1] = f'{pages[-1]}\n{summary}'
+            else:
+                pages.append(summary)
 
-        if self._data_batch:
-            await self.bot.pool.execute(query, self._data_batch)
-            total = len(self._data_batch)
-            if total > 1:
-                log.info('Registered %s commands to the database.', total)
-            self._data_batch.clear()
+        for page in pages:
+            await self.webhook.send(page, username='Gateway', avatar_url='https://i.imgur.com/4PnCKB3.png')
+
+    async def report_stall(self, stall: Stall) -> None:
+        # at most one report a minute, a struggling loop tends to stall repeatedly
+        now = asyncio.get_running_loop().time()
+        if now - self._last_stall_report < 60.0:
+            return
+        self._last_stall_report = now
+
+        e = discord.Embed(title='Event Loop Stall', colour=0xDD5F53)
+        e.description = f'Blocked for {stall.duration * 1000:.0f}ms\n```py\n{stall.stack[-3900:]}\n```'
+        e.timestamp = datetime.fromtimestamp(stall.started, timezone.utc)
+        await self.webhook.send(embed=e)
+
+    async def insert_batch(self, batch: list[DataBatchEntry]) -> None:
+        # the rollups are summed up here so they're one upsert each
+        hourly: Counter[tuple[int, str, datetime]] = Counter()
+        failures: Counter[tuple[int, str, datetime]] = Counter()
+        authors: Counter[tuple[int, int, str, datetime]] = Counter()
+        for entry in batch:
+            guild_id = entry.guild_id or 0
+            bucket = entry.used.replace(minute=0, second=0, microsecond=0)
+            hourly[guild_id, entry.command, bucket] += 1
+            failures[guild_id, entry.command, bucket] += entry.failed
+            authors[guild_id, entry.author_id, entry.command, bucket] += 1
+
+        # one array per column, for unnest
+        hourly_args = [*map(list, zip(*hourly)), list(hourly.values()), [failures[k] for k in hourly]]
+        authors_args = [*map(list, zip(*authors)), list(authors.values())]
+
+        async with self.bot.pool.acquire() as con:
+            async with con.transaction():
+                await Commands.insert_many(batch, columns=DataBatchEntry._fields, connection=con)
+                await CommandsHourly.add_batch.execute(con, *hourly_args)
+                await CommandAuthorsHourly.add_batch.execute(con, *authors_args)
+
+        self.invalidate_reports({entry.guild_id for entry in batch})
+
+    def invalidate_reports(self, guild_ids: Optional[set[Optional[int]]] = None) -> None:
+        """Drops the cached reports of these guilds and the global ones, or all of them."""
+        self._report_epoch += 1
+        if guild_ids is None:
+            self._report_cache.clear()
+        else:
+            self._report_cache.invalidate(lambda key: key[0] is None or key[0] in guild_ids)
+
+    async def fetch_report(self, ctx: Context, query: db.Query, *args: Any,
+                           guild_id: Optional[int] = None, member_id: Optional[int] = None) -> reports.UsageReport:
+        key = (guild_id, member_id, query.name)
+        cached = self._report_cache.get(key)
+        if cached is not None:
+            return cached
+
+        epoch = self._report_epoch
+        result = await reports.UsageReport.fetch(ctx.db, query, *args)
+        if epoch == self._report_epoch:
+            self._report_cache[key] = result
+        return result
+
+    async def bulk_insert(self) -> bool:
+        """Flushes the buffer, returns ``False`` if it had to be spooled to disk."""
+        # swap the buffer out, commands registered during the flush go into a fresh one
+        batch, self._data_batch = self._data_batch, []
+        if not batch:
+            return True
+
+        start = asyncio.get_running_loop().time()
+        try:
+            await self.insert_batch(batch)
+        except UNREACHABLE:
+            await self.spool_batch(batch)
+            self._batch_stats['failed'] += 1
+            log.warning('Could not reach the database, spooled %s commands to disk.', len(batch))
+            return False
+        except Exception:
+            # the database is there but refused the batch, retrying it would fail
+            # the same way forever so it's set aside for a look by hand instead
+            log.exception('Could not insert a batch of %s commands, moving it to %s.', len(batch), self.rejected.path)
+            await asyncio.to_thread(self.rejected.write, batch)
+            self._batch_stats['failed'] += 1
+            self._batch_stats['rejected'] += len(batch)
+            return True
+
+        self._last_flush = asyncio.get_running_loop().time() - start
+        self._batch_stats['flushes'] += 1
+        self._batch_stats['rows'] += len(batch)
+        if len(batch) > 1:
+            log.info('Registered %s commands to the database.', len(batch))
+        return True
+
+    async def spool_batch(self, batch: list[DataBatchEntry]) -> None:
+        await asyncio.to_thread(self.spool.write, batch)
+        self._batch_stats['spooled'] += len(batch)
+
+    async def replay_spool(self) -> None:
+        for _ in range(SPOOL_CHUNKS_PER_FLUSH):
+            if not self.spool:
+                return
+
+            rows, position = await asyncio.to_thread(self.spool.read, SPOOL_CHUNK)
+            if rows:
+                try:
+                    await self.insert_batch(rows)
+                except UNREACHABLE:
+                    # the position isn't committed, the chunk is read again next time
+                    log.warning('Lost the database while replaying the spool, resuming later.')
+                    return
+                except Exception:
+                    log.exception('Could not replay %s spooled commands, moving them to %s.', len(rows), self.rejected.path)
+                    await asyncio.to_thread(self.rejected.write, rows)
+                    self._batch_stats['rejected'] += len(rows)
+                    self.spool.commit(position, 0)
+                    continue
+            self.spool.commit(position, len(rows))
+            log.info('Replayed %s spooled commands to the database.', len(rows))
 
     @discord.utils.cached_property
     def webhook(self) -> discord.Webhook:
@@ -132,15 +469,211 @@ class Stats(commands.Cog):
             id=wh_id, token=wh_token, session=self.bot.session)
         return hook
 
-    @tasks.loop(seconds=10.0)
+    @tasks.loop(seconds=0.0)
     async def bulk_insert_loop(self):
+        pool_label.set(BACKGROUND)
+        try:
+            await asyncio.wait_for(self._flush_requested.wait(), timeout=BATCH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        else:
+            self._batch_stats['early'] += 1
+
+        self._flush_requested.clear()
         async with self._batch_lock:
-            await self.bulk_insert()
+            if await self.bulk_insert() and self.spool:
+                await self.replay_spool()
+
+    @tasks.loop(seconds=5.0)
+    async def sample_system(self):
+        self.sampler.sample()
+
+    @sample_system.before_loop
+    async def before_sample_system(self):
+        await self.sampler.load_hardware()
+
+    def record_latency(self, command: str, seconds: float, used: datetime) -> None:
+        histogram = self.bot.command_latency.get(command)
+        if histogram is None:
+            histogram = self.bot.command_latency[command] = LatencyHistogram()
+        histogram.record(seconds)
+
+        key = (command, used.replace(minute=0, second=0, microsecond=0))
+        delta = self._latency_delta.get(key)
+        if delta is None:
+            delta = self._latency_delta[key] = LatencyHistogram()
+        delta.record(seconds)
+
+    @tasks.loop(minutes=5.0)
+    async def latency_flush(self):
+        pool_label.set(BACKGROUND)
+        delta, self._latency_delta = self._latency_delta, {}
+        if not delta:
+            return
+
+        try:
+            await CommandLatency.add.executemany(self.bot.pool, [(command, bucket, h.counts) for (command, bucket), h in delta.items()])
+        except UNREACHABLE:
+            # merge them back in, they're retried on the next flush
+            for key, histogram in delta.items():
+                current = self._latency_delta.setdefault(key, LatencyHistogram())
+                current.merge(histogram)
+            raise
+        except Exception:
+            # merging a rejected delta back in would only fail the same way again
+            log.exception('Could not save the latency of %s command hours, dropping them.', len(delta))
+
+    def summarise_error(self, group: ErrorGroup) -> str:
+        commands = ', '.join(f'{name} ({count})' for name, count in group.commands.most_common(3))
+        if len(group.commands) > 3:
+            commands = f'{commands} and {len(group.commands) - 3} more'
+        return (
+            f'{group.unreported} more times ({group.count} total)\n'
+            f'Commands: {commands}\n'
+            f'Guilds: {group.guild_count}\n'
+            f'Last seen: {time.format_dt(datetime.fromtimestamp(group.last_seen, timezone.utc), "R")}'
+        )
+
+    async def save_errors(self, groups: list[ErrorGroup]) -> None:
+        # counts can move while the query runs, only mark what was written
+        counts = [g.count for g in groups]
+        args = [
+            (g.fingerprint, g.exc_type, g.message[:1000], datetime.utcfromtimestamp(g.first_seen),
+             datetime.utcfromtimestamp(g.last_seen), count - g.saved)
+            for g, count in zip(groups, counts)
+        ]
+        await CommandErrors.save.executemany(self.bot.pool, args)
+        for group, count in zip(groups, counts):
+            group.saved = count
+
+    @tasks.loop(seconds=ERROR_SUMMARY_INTERVAL)
+    async def error_summary(self):
+        pool_label.set(BACKGROUND)
+        if getattr(self.bot.config, 'error_history', False):
+            unsaved = [g for g in self.errors if g.count > g.saved]
+            if unsaved:
+                try:
+                    await self.save_errors(unsaved)
+                except Exception:
+                    log.exception('Could not save the command error history.')
+
+        repeated = sorted((g for g in self.errors if g.unreported), key=lambda g: g.unreported, reverse=True)
+        if not repeated:
+            return
+
+        e = discord.Embed(title='Repeated Command Errors', colour=self.bot.color)
+        # 25 fields at most, anything past that is only counted
+        for group in repeated[:24]:
+            e.add_field(name=f'{group.exc_type} ({group.fingerprint})', value=self.summarise_error(group), inline=False)
+        if len(repeated) > 24:
+            rest = repeated[24:]
+            e.add_field(name='Others', value=f'{len(rest)} more errors, {sum(g.unreported for g in rest)} occurrences')
+
+        e.timestamp = discord.utils.utcnow()
+        for group in repeated:
+            group.reported = group.count
+        await self.webhook.send(embed=e)
+
+    @error_summary.before_loop
+    async def before_error_summary(self):
+        await self.bot.wait_until_ready()
+
+    @tasks.loop(seconds=10.0)
+    async def pool_watch(self):
+        # every connection held past the threshold is reported once
+        for checkout in self.bot.pool.leaks():
+            if checkout.reported:
+                continue
+
+            checkout.reported = True
+            log.warning('Connection held by %s for %.0fs', checkout.label, checkout.held)
+            e = discord.Embed(title='Database Connection Held', colour=0xDD5F53)
+            e.description = f'Held by `{checkout.label}` for {checkout.held:.0f}s\n```py\n{checkout.stack()[-3800:]}\n```'
+            e.timestamp = discord.utils.utcnow()
+            await self.webhook.send(embed=e)
+
+    @pool_watch.before_loop
+    async def before_pool_watch(self):
+        await self.bot.wait_until_ready()
+
+    @tasks.loop(hours=24.0)
+    async def partition_maintenance(self):
+        pool_label.set(BACKGROUND)
+        # commands is partitioned by month, keep a few months ahead around
+        # and get rid of the ones past the retention period
+        try:
+            await Commands.create_partitions()
+        except asyncpg.PostgresError:
+            log.exception('Could not create the upcoming command partitions.')
+
+        months = getattr(self.bot.config, 'command_retention_months', None)
+        if months is None:
+            return
+
+        now = discord.utils.utcnow()
+        year, month = divmod(now.year * 12 + now.month - 1 - months, 12)
+        archive = getattr(self.bot.config, 'archive_command_partitions', False)
+        try:
+            detached = await Commands.detach_partitions(datetime(year, month + 1, 1), drop=not archive)
+        except asyncpg.PostgresError:
+            # e.g. a lock timeout or a dependent object, tried again tomorrow
+            log.exception('Could not remove the command partitions past retention.')
+            return
+        if detached:
+            log.info('%s command partitions: %s', 'Archived' if archive else 'Dropped', ', '.join(detached))
+
+    @partition_maintenance.before_loop
+    async def before_partition_maintenance(self):
+        await self.bot.wait_until_ready()
+
+    async def compact_rollups(self, query: db.Query, start: datetime, end: datetime) -> None:
+        while True:
+            # the status is INSERT 0 <day rows written>, none means nothing was left
+            status = await query.execute(self.bot.pool, start, end, COMPACT_BATCH)
+            if status.endswith(' 0'):
+                return
+            await asyncio.sleep(0.1)
+
+    @tasks.loop(hours=24.0)
+    async def rollup_compaction(self):
+        pool_label.set(BACKGROUND)
+        days = getattr(self.bot.config, 'rollup_compact_days', COMPACT_AFTER_DAYS)
+        if days is None:
+            return
+
+        cutoff = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
+        day = self._compacted_until
+        try:
+            if day is None:
+                query = """SELECT date_trunc('day', LEAST((SELECT MIN(bucket) FROM commands_hourly),
+                                                          (SELECT MIN(bucket) FROM command_authors_hourly)));
+                        """
+                day = await self.bot.pool.fetchval(query)
+                if day is None:
+                    return
+
+            # a day at a time keeps the scan behind every batch short
+            while day < cutoff:
+                end = day + timedelta(days=1)
+                await self.compact_rollups(CommandsHourly.compact, day, end)
+                await self.compact_rollups(CommandAuthorsHourly.compact, day, end)
+                self._compacted_until = day = end
+        except (asyncpg.PostgresError, *UNREACHABLE):
+            # the days done so far are kept, the next run picks up from there
+            log.exception('Could not compact the command rollups of %s.', day)
+
+    @rollup_compaction.before_loop
+    async def before_rollup_compaction(self):
+        await self.bot.wait_until_ready()
 
     @tasks.loop(seconds=0.0)
     async def gateway_worker(self):
-        record = await self._gateway_queue.get()
-        await self.notify_gateway_status(record)
+        records = [await self._gateway_queue.get()]
+        # let the rest of a reconnect burst arrive so it goes out together
+        await asyncio.sleep(GATEWAY_WINDOW)
+        while not self._gateway_queue.empty():
+            records.append(self._gateway_queue.get_nowait())
+        await self.notify_gateway_status(records)
 
     async def register_command(self, ctx: Context) -> None:
         if ctx.command is None:
@@ -159,18 +692,71 @@ class Stats(commands.Cog):
 
         log.info(
             f'{message.created_at}: {message.author} in {destination}: {message.content}')
-        async with self._batch_lock:
-            self._data_batch.append(
-                {
-                    'guild': guild_id,
-                    'channel': ctx.channel.id,
-                    'author': ctx.author.id,
-                    'used': message.created_at.isoformat(),
-                    'prefix': ctx.prefix,
-                    'command': command,
-                    'failed': ctx.command_failed,
-                }
-            )
+        # created_at is aware UTC, the column is a naive UTC timestamp
+        used = message.created_at.replace(tzinfo=None)
+        if ctx.invoked_at is not None:
+            self.record_latency(command, asyncio.get_running_loop().time() - ctx.invoked_at, used)
+
+        self._data_batch.append(DataBatchEntry(
+            guild_id,
+            ctx.channel.id,
+            ctx.author.id,
+            used,
+            ctx.prefix,
+            command,
+            ctx.command_failed,
+        ))
+
+        pending = len(self._data_batch)
+        self._batch_peak = max(self._batch_peak, pending)
+        if pending > BATCH_MAX_SIZE:
+            # the database isn't keeping up, move the backlog to disk to bound memory
+            backlog, self._data_batch = self._data_batch, []
+            await self.spool_batch(backlog)
+        if pending >= BATCH_FLUSH_SIZE:
+            self._flush_requested.set()
+
+    @commands.Cog.listener()
+    async def on_ready(self) -> None:
+        # resync after every (re)connect in case an event was missed
+        self.bot.counters.rebuild(self.bot.guilds)
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild: discord.Guild) -> None:
+        self.bot.counters.add_guild(guild)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild) -> None:
+        self.bot.counters.remove_guild(guild)
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member) -> None:
+        self.bot.counters.add_member(member)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member: discord.Member) -> None:
+        self.bot.counters.remove_member(member)
+
+    @commands.Cog.listener()
+    async def on_presence_update(self, before: discord.Member, after: discord.Member) -> None:
+        self.bot.counters.update_presence(before, after)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_create(self, channel: discord.abc.GuildChannel) -> None:
+        self.bot.counters.add_channel(channel)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel) -> None:
+        self.bot.counters.remove_channel(channel)
+
+    @commands.Cog.listener()
+    async def on_socket_event_type(self, event_type: str) -> None:
+        self.bot.socket_stats[event_type] += 1
+        self.bot.gateway_stats.event(event_type, self.bot.shard_id or 0)
+
+    @commands.Cog.listener()
+    async def on_socket_raw_receive(self, msg: str) -> None:
+        self.bot.gateway_stats.received(msg, self.bot.shard_id or 0)
 
     @commands.Cog.listener()
     async def on_command_completion(self, ctx: Context):
@@ -186,6 +772,12 @@ class Stats(commands.Cog):
         if isinstance(error, (discord.Forbidden, discord.NotFound, menus.MenuError)):
             return
 
+        group, new = self.errors.record(error, ctx.command.qualified_name, ctx.guild and ctx.guild.id)
+        if not new:
+            # already posted, it's folded into the next summary
+            return
+
+        group.reported = group.count
         e = discord.Embed(title='Command Error', colour=self.bot.color)
         e.add_field(name='Name', value=ctx.command.qualified_name)
         e.add_field(name='Author', value=f'{ctx.author} (ID: {ctx.author.id})')
@@ -201,6 +793,7 @@ class Stats(commands.Cog):
         exc = ''.join(traceback.format_exception(
             type(error), error, error.__traceback__, chain=False))
         e.description = f'```py\n{exc}\n```'
+        e.set_footer(text=f'Fingerprint: {group.fingerprint}')
         e.timestamp = discord.utils.utcnow()
         await self.webhook.send(embed=e)
 
@@ -219,24 +812,24 @@ class Stats(commands.Cog):
         try:
             embed = FooterEmbed(self.bot)
 
-            # statistics
-            total_members = sum(1 for _ in self.bot.get_all_members())
-            total_online = len({m.id for m in self.bot.get_all_members(
-            ) if m.status is not discord.Status.offline})
-            total_unique = len(self.bot.users)
-
-            voice_channels = []
-            text_channels = []
-            for guild in self.bot.guilds:
-                voice_channels.extend(guild.voice_channels)
-                text_channels.extend(guild.text_channels)
-
-            text = len(text_channels)
-            voice = len(voice_channels)
-            payload = f'```fix\n{"Members":10}: {total_members}\n{"Channels":10}: {text + voice}\n{"Servers":10}: {str(len(self.bot.guilds) - len(self.bot.emote_servers))}\n{"Uptime":10}: {self.get_bot_uptime(brief=True)}```\n'
+            # statistics, kept up to date by the event listeners below
+            counters = self.bot.counters
+            payload = f'```fix\n{"Members":10}: {counters.members}\n{"Channels":10}: {counters.channels}\n{"Servers":10}: {str(counters.guilds - len(self.bot.emote_servers))}\n{"Uptime":10}: {self.get_bot_uptime(brief=True)}```\n'
             embed.add_field(
                 name=f'{"="*15} {"Discord information".center(20)} {"="*15}', value=payload)
 
+            pool = self.bot.pool
+            wait = pool.wait
+            payload = (
+                f'```fix\n{"Pool":10}: {pool.checked_out} in use, {pool.get_size()} open '
+                f'({pool.get_min_size()}-{pool.get_max_size()}), peak {pool.peak}\n'
+                f'{"Acquire":10}: p50 {wait.quantile(0.5):.1f}ms, p99 {wait.quantile(0.99):.1f}ms, '
+                f'{pool.timeouts} timed out\n'
+                f'{"Leaks":10}: {len(pool.leaks())} held over {pool.leak_threshold:.0f}s```'
+            )
+            embed.add_field(
+                name=f'{"="*15} {"Database information".center(20)} {"="*15}', value=payload, inline=False)
+
             info_embeds = self.System_information()
             info_embeds.append(embed)
             await message.edit(content=None, embeds=info_embeds)
@@ -258,70 +851,58 @@ class Stats(commands.Cog):
             bytes /= factor
 
     def System_information(self):
+        # everything here comes from the background sampler, nothing blocks
+        hardware = self.sampler.hardware
+        sample = self.sampler.latest
         system_embed = discord.Embed(color=self.bot.color)
-        uname = platform.uname()
+        cpu_embed = discord.Embed(color=self.bot.color)
+        if hardware is None or sample is None:
+            system_embed.description = 'System information is still being collected.'
+            return [system_embed]
+
         system_payload = f"```fix\n"
-        system_payload += f"{'System':10}: {uname.system}\n"
-        system_payload += f"{'Node name':10}: {uname.node}\n"
-        system_payload += f"{'Release':10}: {uname.release}\n"
-        system_payload += f"{'Version':10}: {uname.version}\n"
-        system_payload += f"{'Machine':10}: {uname.machine}\n"
-        # system_payload += f"{'Processor':10}: {uname.processor}\n"
-        system_payload += f"{'Processor':10}: {cpuinfo.get_cpu_info()['brand_raw']}\n"
+        system_payload += f"{'System':10}: {hardware.system}\n"
+        system_payload += f"{'Node name':10}: {hardware.node}\n"
+        system_payload += f"{'Release':10}: {hardware.release}\n"
+        system_payload += f"{'Version':10}: {hardware.version}\n"
+        system_payload += f"{'Machine':10}: {hardware.machine}\n"
+        system_payload += f"{'Processor':10}: {hardware.processor}\n"
         # system_payload += f"{'Ip-address':10}: {socket.gethostbyname(socket.gethostname())}\n"
         # system_payload += f"{'Mac-address':10}: {':'.join(re.findall('..', '%012x' % uuid.getnode()))}\n"
-        boot_time_timestamp = psutil.boot_time()
-        bt = datetime.fromtimestamp(boot_time_timestamp)
+        bt = hardware.boot_time
         system_payload += f"{'Boot Time':10}: {bt.year}/{bt.month}/{bt.day} {bt.hour}:{bt.minute}:{bt.second}"
         system_payload += f"```"
         system_embed.add_field(
             name=f'{"="*15} {"System Information".center(20)} {"="*15}', value=system_payload)
-        # # Boot Time
-        # boot_payload = f"```fix\n"
-        # boot_time_timestamp = psutil.boot_time()
-        # bt = datetime.fromtimestamp(boot_time_timestamp)
-        # boot_payload += f"{'Boot Time':10}: {bt.year}/{bt.month}/{bt.day} {bt.hour}:{bt.minute}:{bt.second}"
-        # boot_payload += f"```"
-        # boot_embed = discord.Embed(color=self.bot.color)
-        # boot_embed.add_field(
-        #     name=f'{"="*15} {"Boot Time".center(20)} {"="*15}', value=boot_payload)
 
         # print CPU information
-        cpu_embed = discord.Embed(color=self.bot.color)
         cpu_payload = f"```fix\n"
         # number of cores
-        cpu_payload += f"{'Physical cores':10}: {psutil.cpu_count(logical=False)}\n"
-        cpu_payload += f"{'Total cores':10}: {psutil.cpu_count(logical=True)}\n"
+        cpu_payload += f"{'Physical cores':10}: {hardware.physical_cores}\n"
+        cpu_payload += f"{'Total cores':10}: {hardware.logical_cores}\n"
         # CPU frequencies
-        cpufreq = psutil.cpu_freq()
-        cpu_payload += f"{'Max Frequency':10}: {cpufreq.max:.2f}Mhz\n"
-        cpu_payload += f"{'Min Frequency':10}: {cpufreq.min:.2f}Mhz\n"
-        cpu_payload += f"{'Current Frequency':10}: {cpufreq.current:.2f}Mhz\n"
+        cpu_payload += f"{'Max Frequency':10}: {hardware.max_frequency:.2f}Mhz\n"
+        cpu_payload += f"{'Min Frequency':10}: {hardware.min_frequency:.2f}Mhz\n"
+        cpu_payload += f"{'Current Frequency':10}: {sample.frequency:.2f}Mhz\n"
         # CPU usage
         cpu_payload += f"{'CPU Usage Per Core'}:\n"
-        for i, percentage in enumerate(psutil.cpu_percent(percpu=True, interval=1)):
+        for i, percentage in enumerate(sample.cpu_per_core):
             cpu_payload += f"{f'Core {i}':10}: {percentage}%\n"
-        cpu_payload += f"{'Total CPU Usage'}: {psutil.cpu_percent()}%\n"
+        cpu_payload += f"{'Total CPU Usage'}: {sample.cpu}% ({self.sampler.average('cpu'):.1f}% over the last minute)\n"
         cpu_payload += f"```"
         cpu_embed.add_field(
             name=f'{"="*15} {"CPU Information".center(20)} {"="*15}', value=cpu_payload)
 
-        # # Memory Information
-        # print("="*15, "Memory Information", "="*15)
-        # # get the memory details
-        # svmem = psutil.virtual_memory()
-        # print(f"Total: {self.get_size(svmem.total)}")
-        # print(f"Available: {self.get_size(svmem.available)}")
-        # print(f"Used: {self.get_size(svmem.used)}")
-        # print(f"Percentage: {svmem.percent}%")
-
-        # print("="*15, "SWAP", "="*15)
-        # # get the swap memory details (if exists)
-        # swap = psutil.swap_memory()
-        # print(f"Total: {self.get_size(swap.total)}")
-        # print(f"Free: {self.get_size(swap.free)}")
-        # print(f"Used: {self.get_size(swap.used)}")
-        # print(f"Percentage: {swap.percent}%")
+        # Memory and process information
+        memory_payload = f"```fix\n"
+        memory_payload += f"{'Memory':10}: {self.get_size(sample.memory_used)}/{self.get_size(sample.memory_total)} ({sample.memory}%)\n"
+        memory_payload += f"{'Process RSS':10}: {self.get_size(sample.rss)}\n"
+        memory_payload += f"{'Threads':10}: {sample.threads}\n"
+        if sample.fds is not None:
+            memory_payload += f"{'Open files':10}: {sample.fds}\n"
+        memory_payload += f"```"
+        cpu_embed.add_field(
+            name=f'{"="*15} {"Memory Information".center(20)} {"="*15}', value=memory_payload, inline=False)
 
         # # Disk Information
         # print("="*15, "Disk Information", "="*15)
@@ -384,176 +965,158 @@ class Stats(commands.Cog):
         else:
             common = counter.most_common()[limit:]
 
-        output = '\n'.join(f'{k:<{width}}: {c}' for k, c in common)
+        def entry(command: str, count: int) -> str:
+            histogram = self.bot.command_latency.get(command)
+            if not histogram:
+                return f'{command:<{width}}: {count}'
+            return f'{command:<{width}}: {count:<5} {histogram.summary()}'
+
+        output = '\n'.join(entry(k, c) for k, c in common)
 
         await ctx.send(f'```\n{output}\n```')
 
     @commands.hybrid_command(hidden=True)
-    async def socketstats(self, ctx: Context):
+    async def socketstats(self, ctx: Context, limit: int = 15):
+        """Shows the gateway events received, by type and by shard."""
         delta = discord.utils.utcnow() - self.bot.uptime
         minutes = delta.total_seconds() / 60
         total = sum(self.bot.socket_stats.values())
         cpm = total / minutes
-        await ctx.send(f'{total} socket events observed ({cpm:.2f}/minute):\n{self.bot.socket_stats}')
+        stats = self.bot.gateway_stats
+
+        table = TabularData()
+        table.set_columns(['Event', '1m', '5m', '1h', 'Total', 'KiB (1h)'])
+        busiest = sorted(stats.events.items(), key=lambda t: t[1].count(300), reverse=True)[:limit]
+        for event_type, counter in busiest:
+            received = stats.bytes.get(event_type)
+            size = received.count(3600) / 1024 if received is not None else 0
+            table.add_row([event_type, counter.count(60), counter.count(300), counter.count(3600),
+                           counter.total, f'{size:.1f}'])
+
+        shards = '\n'.join(
+            f'Shard {shard_id}: {counter.count(60)}/1m, {counter.count(300)}/5m, {counter.count(3600)}/1h, '
+            f'{stats.shard_bytes[shard_id] / 1048576:.2f} MiB received'
+            for shard_id, counter in sorted(stats.shards.items())
+        )
+        await ctx.send(f'{total} socket events observed ({cpm:.2f}/minute):\n```\n{table.render()}\n```{shards}')
 
-    async def show_guild_stats(self, ctx, message) -> None:
-        lookup = (
-            '\N{FIRST PLACE MEDAL}',
-            '\N{SECOND PLACE MEDAL}',
-            '\N{THIRD PLACE MEDAL}',
-            '\N{SPORTS MEDAL}',
-            '\N{SPORTS MEDAL}',
+    @commands.hybrid_command(hidden=True)
+    @commands.is_owner()
+    async def batchstats(self, ctx: Context):
+        """Shows how the command stats ingestion is keeping up."""
+        stats = self._batch_stats
+        output = (
+            f'Pending: {len(self._data_batch)} (peak {self._batch_peak}, flushing at {BATCH_FLUSH_SIZE})\n'
+            f'Flushes: {stats["flushes"]} ({stats["early"]} early, {stats["failed"]} failed)\n'
+            f'Rows: {stats["rows"]} ingested, {stats["spooled"]} spooled, {stats["rejected"]} rejected\n'
+            f'Spool: {self.spool.replayed} replayed, {self.spool.corrupt} corrupt, {self.spool.size() / 1024:.2f} KiB pending\n'
+            f'Last flush: {self._last_flush * 1000:.2f}ms'
         )
-        embed = discord.Embed(title='Server Command Stats',
-                              colour=self.bot.color)
+        await ctx.send(f'```\n{output}\n```')
 
-        # total command uses
-        query = "SELECT COUNT(*), MIN(used) FROM commands WHERE guild_id=$1;"
-        # type: ignore
-        count: tuple[int, datetime.datetime] = await ctx.db.fetchrow(query, ctx.guild.id)
+    @commands.hybrid_command(hidden=True)
+    @commands.is_owner()
+    async def poolstats(self, ctx: Context):
+        """Shows how long connections are waited for and held, per command."""
+        pool = self.bot.pool
+        table = TabularData()
+        table.set_columns(['Holder', 'Checkouts', 'p50', 'p99', 'Max'])
+        rows = sorted(pool.held.items(), key=lambda t: t[1].count, reverse=True)[:15]
+        for label, held in rows:
+            table.add_row([label, held.count, *(f'{held.quantile(q):.0f}ms' for q in (0.5, 0.99, 1.0))])
+
+        wait = pool.wait
+        summary = (
+            f'{pool.checked_out} checked out, {pool.get_idle_size()} idle, {pool.get_size()} open '
+            f'(bounds {pool.get_min_size()}-{pool.get_max_size()}, peak {pool.peak} in use)\n'
+            f'Acquire waits: {wait.count} total, p50 {wait.quantile(0.5):.1f}ms, p99 {wait.quantile(0.99):.1f}ms, '
+            f'{pool.timeouts} timed out'
+        )
+        output = table.render() if rows else 'No connections released yet.'
+        await ctx.send(f'{summary}\n```\n{output}\n```')
+
+        for checkout in pool.leaks()[:3]:
+            await ctx.send(f'Held by `{checkout.label}` for {checkout.held:.0f}s\n```py\n{checkout.stack()[-1800:]}\n```')
+
+    @commands.hybrid_command(hidden=True)
+    @commands.is_owner()
+    async def looplag(self, ctx: Context, stalls: int = 1):
+        """Shows the event loop lag histogram and the most recent stalls."""
+        monitor = self.loop_monitor
+        width = max(monitor.counts) or 1
+        rows = []
+        for bound, count in zip(LAG_BUCKETS, monitor.counts):
+            label = '>5000ms' if bound == float('inf') else f'<={bound}ms'
+            rows.append(f'{label:>8}: {"#" * round(20 * count / width):<20} {count}')
+
+        output = '\n'.join(rows)
+        summary = (
+            f'{monitor.samples} samples, last {monitor.last_lag * 1000:.2f}ms, max {monitor.max_lag * 1000:.2f}ms, '
+            f'p50 <= {monitor.percentile(0.5):.0f}ms, p99 <= {monitor.percentile(0.99):.0f}ms'
+        )
+        await ctx.send(f'{summary}\n```\n{output}\n```')
 
-        embed.description = f'{count[0]} commands used.'
-        if count[1]:
-            timestamp = count[1].replace(tzinfo=timezone.utc)
+        recent = list(monitor.stalls)[-stalls:] if stalls > 0 else []
+        for stall in recent:
+            when = time.format_dt(datetime.fromtimestamp(stall.started, timezone.utc), 'R')
+            await ctx.send(f'Blocked for {stall.duration * 1000:.0f}ms {when}\n```py\n{stall.stack[-1800:]}\n```')
+
+    async def show_guild_stats(self, ctx, message) -> None:
+        report = await self.fetch_report(ctx, CommandsHourly.guild_report, ctx.guild.id, guild_id=ctx.guild.id)
+        embed = discord.Embed(title='Server Command Stats',
+                              colour=self.bot.color)
+        embed.description = f'{report.total} commands used.'
+        if report.since:
+            timestamp = report.since.replace(tzinfo=timezone.utc)
         else:
             timestamp = discord.utils.utcnow()
         embed.set_footer(
             text='Tracking command usage since').timestamp = timestamp
 
-        query = """SELECT command,
-                          COUNT(*) as "uses"
-                   FROM commands
-                   WHERE guild_id=$1
-                   GROUP BY command
-                   ORDER BY "uses" DESC
-                   LIMIT 5;
-                """
-        records = await ctx.db.fetch(query, ctx.guild.id)
-        value = (
-            '\n'.join(f'{lookup[index]}: {command} ({uses} uses)' for (
-                index, (command, uses)) in enumerate(records))
-            or 'No Commands'
-        )
-
-        embed.add_field(name='Top Commands', value=value, inline=True)
-
-        query = """SELECT command,
-                          COUNT(*) as "uses"
-                   FROM commands
-                   WHERE guild_id=$1
-                   AND used > (CURRENT_TIMESTAMP - INTERVAL '1 day')
-                   GROUP BY command
-                   ORDER BY "uses" DESC
-                   LIMIT 5;
-                """
-        records = await ctx.db.fetch(query, ctx.guild.id)
-        value = (
-            '\n'.join(f'{lookup[index]}: {command} ({uses} uses)' for (
-                index, (command, uses)) in enumerate(records))
-            or 'No Commands.'
-        )
-        embed.add_field(name='Top Commands Today', value=value, inline=True)
+        embed.add_field(name='Top Commands', value=report.leaderboard(
+            'commands', reports.command_entry), inline=True)
+        embed.add_field(name='Top Commands Today', value=report.leaderboard(
+            'commands_today', reports.command_entry), inline=True)
         embed.add_field(name='\u200b', value='\u200b', inline=True)
-        query = """SELECT author_id,
-                          COUNT(*) AS "uses"
-                   FROM commands
-                   WHERE guild_id=$1
-                   GROUP BY author_id
-                   ORDER BY "uses" DESC
-                   LIMIT 5;
-                """
-        records = await ctx.db.fetch(query, ctx.guild.id)
-
-        value = (
-            '\n'.join(
-                f'{lookup[index]}: <@!{author_id}> ({uses} bot uses)' for (index, (author_id, uses)) in enumerate(records)
-            )
-            or 'No bot users.'
-        )
-
-        embed.add_field(name='Top Command Users', value=value, inline=True)
-        query = """SELECT author_id,
-                          COUNT(*) AS "uses"
-                   FROM commands
-                   WHERE guild_id=$1
-                   AND used > (CURRENT_TIMESTAMP - INTERVAL '1 day')
-                   GROUP BY author_id
-                   ORDER BY "uses" DESC
-                   LIMIT 5;
-                """
-        records = await ctx.db.fetch(query, ctx.guild.id)
-        value = (
-            '\n'.join(
-                f'{lookup[index]}: <@!{author_id}> ({uses} bot uses)' for (index, (author_id, uses)) in enumerate(records)
-            )
-            or 'No command users.'
-        )
-        embed.add_field(name='Top Command Users Today',
-                        value=value, inline=True)
+        embed.add_field(name='Top Command Users', value=report.leaderboard(
+            'authors', self.mention_entry, empty='No bot users.'), inline=True)
+        embed.add_field(name='Top Command Users Today', value=report.leaderboard(
+            'authors_today', self.mention_entry, empty='No command users.'), inline=True)
         await message.edit(embed=embed, content=None)
 
     async def show_member_stats(self, ctx, member: discord.Member, message) -> None:
-        lookup = (
-            '\N{FIRST PLACE MEDAL}',
-            '\N{SECOND PLACE MEDAL}',
-            '\N{THIRD PLACE MEDAL}',
-            '\N{SPORTS MEDAL}',
-            '\N{SPORTS MEDAL}',
-        )
+        report = await self.fetch_report(ctx, CommandAuthorsHourly.member_report, ctx.guild.id, member.id,
+                                         guild_id=ctx.guild.id, member_id=member.id)
         embed = discord.Embed(title='Command Stats', colour=member.colour)
         embed.set_author(name=str(member), icon_url=member.display_avatar.url)
-
-        # total command uses
-        query = "SELECT COUNT(*), MIN(used) FROM commands WHERE guild_id=$1 AND author_id=$2;"
-        # type: ignore
-        count: tuple[int, datetime.datetime] = await ctx.db.fetchrow(query, ctx.guild.id, member.id)
-        embed.description = f'{count[0]} commands used.'
-        if count[1]:
-            timestamp = count[1].replace(tzinfo=timezone.utc)
+        embed.description = f'{report.total} commands used.'
+        if report.since:
+            timestamp = report.since.replace(tzinfo=timezone.utc)
         else:
             timestamp = discord.utils.utcnow()
         embed.set_footer(text='First command used').timestamp = timestamp
 
-        query = """SELECT command,
-                          COUNT(*) as "uses"
-                   FROM commands
-                   WHERE guild_id=$1 AND author_id=$2
-                   GROUP BY command
-                   ORDER BY "uses" DESC
-                   LIMIT 5;
-                """
-
-        records = await ctx.db.fetch(query, ctx.guild.id, member.id)
-
-        value = (
-            '\n'.join(f'{lookup[index]}: {command} ({uses} uses)' for (
-                index, (command, uses)) in enumerate(records))
-            or 'No Commands'
-        )
-        embed.add_field(name='Most Used Commands', value=value, inline=False)
-
-        query = """SELECT command,
-                          COUNT(*) as "uses"
-                   FROM commands
-                   WHERE guild_id=$1
-                   AND author_id=$2
-                   AND used > (CURRENT_TIMESTAMP - INTERVAL '1 day')
-                   GROUP BY command
-                   ORDER BY "uses" DESC
-                   LIMIT 5;
-                """
+        embed.add_field(name='Most Used Commands', value=report.leaderboard(
+            'commands', reports.command_entry), inline=False)
+        embed.add_field(name='Most Used Commands Today', value=report.leaderboard(
+            'commands_today', reports.command_entry), inline=False)
+        await message.edit(embed=embed, content=None)
 
-        records = await ctx.db.fetch(query, ctx.guild.id, member.id)
+    def mention_entry(self, author_id: str, uses: int) -> str:
+        return f'<@!{author_id}> ({uses} bot uses)'
 
-        value = (
-            '\n'.join(f'{lookup[index]}: {command} ({uses} uses)' for (
-                index, (command, uses)) in enumerate(records))
-            or 'No Commands'
-        )
+    def guild_entry(self, guild_id: str, uses: int) -> str:
+        if guild_id == '0':
+            guild = 'Private Message'
+        else:
+            guild = self.censor_object(self.bot.get_guild(
+                int(guild_id)) or f'<Unknown {guild_id}>')
+        return f'{guild} ({uses} uses)'
 
-        embed.add_field(name='Most Used Commands Today',
-                        value=value, inline=False)
-        await message.edit(embed=embed, content=None)
+    def user_entry(self, author_id: str, uses: int) -> str:
+        user = self.censor_object(self.bot.get_user(
+            int(author_id)) or f'<Unknown {author_id}>')
+        return f'{user} ({uses} uses)'
 
     @commands.hybrid_command()
     @commands.guild_only()
@@ -577,66 +1140,16 @@ class Stats(commands.Cog):
     async def stats_global(self, ctx: Context):
         """Global all time command statistics."""
         message = await ctx.send(content='Just a moment...')
-        query = "SELECT COUNT(*) FROM commands;"
-        total: tuple[int] = await ctx.db.fetchrow(query)  # type: ignore
+        report = await self.fetch_report(ctx, CommandsHourly.global_report)
         e = discord.Embed(title='Command Stats',
                           colour=self.bot.color)
-        e.description = f'{total[0]} commands used.'
-
-        lookup = (
-            '\N{FIRST PLACE MEDAL}',
-            '\N{SECOND PLACE MEDAL}',
-            '\N{THIRD PLACE MEDAL}',
-            '\N{SPORTS MEDAL}',
-            '\N{SPORTS MEDAL}',
-        )
-
-        query = """SELECT command, COUNT(*) AS "uses"
-                   FROM commands
-                   GROUP BY command
-                   ORDER BY "uses" DESC
-                   LIMIT 5;
-                """
-
-        records = await ctx.db.fetch(query)
-        value = '\n'.join(f'{lookup[index]}: {command} ({uses} uses)' for (
-            index, (command, uses)) in enumerate(records))
-        e.add_field(name='Top Commands', value=value, inline=False)
-
-        query = """SELECT guild_id, COUNT(*) AS "uses"
-                   FROM commands
-                   GROUP BY guild_id
-                   ORDER BY "uses" DESC
-                   LIMIT 5;
-                """
-        records = await ctx.db.fetch(query)
-        value = []
-        for (index, (guild_id, uses)) in enumerate(records):
-            if guild_id is None:
-                guild = 'Private Message'
-            else:
-                guild = self.censor_object(self.bot.get_guild(
-                    guild_id) or f'<Unknown {guild_id}>')
-
-            emoji = lookup[index]
-            value.append(f'{emoji}: {guild} ({uses} uses)')
-        e.add_field(name='Top Guilds', value='\n'.join(value), inline=False)
-
-        query = """SELECT author_id, COUNT(*) AS "uses"
-                   FROM commands
-                   GROUP BY author_id
-                   ORDER BY "uses" DESC
-                   LIMIT 5;
-                """
-        records = await ctx.db.fetch(query)
-        value = []
-        for (index, (author_id, uses)) in enumerate(records):
-            user = self.censor_object(self.bot.get_user(
-                author_id) or f'<Unknown {author_id}>')
-            emoji = lookup[index]
-            value.append(f'{emoji}: {user} ({uses} uses)')
-
-        e.add_field(name='Top Users', value='\n'.join(value), inline=False)
+        e.description = f'{report.total} commands used.'
+        e.add_field(name='Top Commands', value=report.leaderboard(
+            'commands', reports.command_entry), inline=False)
+        e.add_field(name='Top Guilds', value=report.leaderboard(
+            'guilds', self.guild_entry), inline=False)
+        e.add_field(name='Top Users', value=report.leaderboard(
+            'authors', self.user_entry), inline=False)
         await message.edit(embed=e, content=None)
 
     @usage.command(name='today')
@@ -644,86 +1157,128 @@ class Stats(commands.Cog):
     async def stats_today(self, ctx: Context):
         """Global command statistics for the day."""
         message = await ctx.send(content='Just a moment...')
-        query = "SELECT failed, COUNT(*) FROM commands WHERE used > (CURRENT_TIMESTAMP - INTERVAL '1 day') GROUP BY failed;"
-        total = await ctx.db.fetch(query)
-        failed = 0
-        success = 0
-        question = 0
-        for state, count in total:
-            if state is False:
-                success += count
-            elif state is True:
-                failed += count
-            else:
-                question += count
-
+        report = await self.fetch_report(ctx, CommandsHourly.today_report)
         e = discord.Embed(title='Last 24 Hour Command Stats',
                           colour=self.bot.color)
         e.description = (
-            f'{failed + success + question} commands used today. '
-            f'({success} succeeded, {failed} failed, {question} unknown)'
-        )
-
-        lookup = (
-            '\N{FIRST PLACE MEDAL}',
-            '\N{SECOND PLACE MEDAL}',
-            '\N{THIRD PLACE MEDAL}',
-            '\N{SPORTS MEDAL}',
-            '\N{SPORTS MEDAL}',
+            f'{report.total} commands used today. '
+            f'({report.total - report.failures} succeeded, {report.failures} failed)'
         )
+        e.add_field(name='Top Commands', value=report.leaderboard(
+            'commands', reports.command_entry), inline=False)
+        e.add_field(name='Top Guilds', value=report.leaderboard(
+            'guilds', self.guild_entry), inline=False)
+        e.add_field(name='Top Users', value=report.leaderboard(
+            'authors', self.user_entry), inline=False)
+        await message.edit(embed=e, content=None)
 
-        query = """SELECT command, COUNT(*) AS "uses"
-                   FROM commands
-                   WHERE used > (CURRENT_TIMESTAMP - INTERVAL '1 day')
-                   GROUP BY command
-                   ORDER BY "uses" DESC
-                   LIMIT 5;
+    @usage.command(name='latency')
+    @commands.is_owner()
+    async def stats_latency(self, ctx: Context, days: int = 7, *, command: Optional[str] = None):
+        """Command latency percentiles over the last days.
+        With a command, shows how it changed day by day instead.
+        """
+        query = """SELECT command, date_trunc('day', bucket) AS day, counts
+                   FROM command_latency
+                   WHERE bucket >= (now() at time zone 'utc') - make_interval(days => $1)
                 """
+        args: list[Any] = [days]
+        if command is not None:
+            query += ' AND command = $2'
+            args.append(command)
+
+        records = await ctx.db.fetch(query, *args)
+        if not records:
+            return await ctx.send('No latency recorded for that.')
+
+        grouped: dict[Any, LatencyHistogram] = {}
+        for record in records:
+            key = record['day'] if command is not None else record['command']
+            histogram = grouped.setdefault(key, LatencyHistogram())
+            histogram.merge(LatencyHistogram(record['counts']))
+
+        table = TabularData()
+        table.set_columns(['Day' if command is not None else 'Command', 'Uses', 'p50', 'p95', 'p99'])
+        if command is not None:
+            rows = sorted(grouped.items())
+        else:
+            rows = sorted(grouped.items(), key=lambda t: t[1].count, reverse=True)[:15]
 
-        records = await ctx.db.fetch(query)
-        value = '\n'.join(f'{lookup[index]}: {command} ({uses} uses)' for (
-            index, (command, uses)) in enumerate(records))
-        e.add_field(name='Top Commands', value=value, inline=False)
+        for key, histogram in rows:
+            label = key.strftime('%Y-%m-%d') if command is not None else key
+            table.add_row([label, histogram.count, *(f'{histogram.quantile(q):.0f}ms' for q in (0.5, 0.95, 0.99))])
 
-        query = """SELECT guild_id, COUNT(*) AS "uses"
-                   FROM commands
-                   WHERE used > (CURRENT_TIMESTAMP - INTERVAL '1 day')
-                   GROUP BY guild_id
-                   ORDER BY "uses" DESC
-                   LIMIT 5;
-                """
+        await ctx.send(f'```\n{table.render()}\n```')
 
-        records = await ctx.db.fetch(query)
-        value = []
-        for (index, (guild_id, uses)) in enumerate(records):
-            if guild_id is None:
-                guild = 'Private Message'
-            else:
-                guild = self.censor_object(self.bot.get_guild(
-                    guild_id) or f'<Unknown {guild_id}>')
-            emoji = lookup[index]
-            value.append(f'{emoji}: {guild} ({uses} uses)')
+    @usage.command(name='export', extras={'long_running': True})
+    @commands.is_owner()
+    async def stats_export(self, ctx: Context, days: Optional[int] = None, *, path: Optional[str] = None):
+        """Exports the raw command usage as a gzipped CSV.
+        Optionally only the last days of it. Without a path the file is uploaded here.
+        """
+        query = 'SELECT id, guild_id, channel_id, author_id, used, prefix, command, failed FROM commands'
+        args: list[Any] = []
+        if days is not None:
+            query += " WHERE used >= (now() at time zone 'utc') - make_interval(days => $1)"
+            args.append(days)
+
+        filename = f'commands-{discord.utils.utcnow():%Y%m%d-%H%M%S}.csv.gz'
+        upload = path is None
+        if upload:
+            path = os.path.join(tempfile.gettempdir(), filename)
+
+        start = asyncio.get_running_loop().time()
+        async with ctx.typing():
+            async with ctx.acquire():
+                try:
+                    rows = await export_query(ctx.db, path, query, *args)
+                except Exception:
+                    if upload and os.path.exists(path):
+                        os.remove(path)
+                    raise
+
+        elapsed = asyncio.get_running_loop().time() - start
+        size = os.path.getsize(path)
+        summary = f'Exported {rows} rows ({human_size(size)}) in {elapsed:.2f}s'
+        if not upload:
+            return await ctx.send(f'{summary} to `{path}`.')
+
+        # 8 MiB is the limit in private messages
+        limit = ctx.guild.filesize_limit if ctx.guild else 8 * 1024 * 1024
+        if size > limit:
+            return await ctx.send(f'{summary}, too large to upload. It was kept at `{path}`.')
 
-        e.add_field(name='Top Guilds', value='\n'.join(value), inline=False)
+        try:
+            await ctx.send(f'{summary}.', file=discord.File(path, filename=filename))
+        finally:
+            os.remove(path)
 
-        query = """SELECT author_id, COUNT(*) AS "uses"
+    @usage.command(name='rebuild', extras={'long_running': True})
+    @commands.is_owner()
+    async def stats_rebuild(self, ctx: Context):
+        """Rebuilds the hourly rollups from the raw commands table."""
+        # only the retained part of commands can be rebuilt, older rollups are kept
+        query = """DELETE FROM commands_hourly WHERE bucket >= (SELECT date_trunc('hour', MIN(used)) FROM commands);
+                   DELETE FROM command_authors_hourly WHERE bucket >= (SELECT date_trunc('hour', MIN(used)) FROM commands);
+                   INSERT INTO commands_hourly (guild_id, command, bucket, uses, failures)
+                   SELECT COALESCE(guild_id, 0), command, date_trunc('hour', used), COUNT(*), COUNT(*) FILTER (WHERE failed)
                    FROM commands
-                   WHERE used > (CURRENT_TIMESTAMP - INTERVAL '1 day')
-                   GROUP BY author_id
-                   ORDER BY "uses" DESC
-                   LIMIT 5;
+                   GROUP BY 1, 2, 3;
+                   INSERT INTO command_authors_hourly (guild_id, author_id, command, bucket, uses)
+                   SELECT COALESCE(guild_id, 0), author_id, command, date_trunc('hour', used), COUNT(*)
+                   FROM commands
+                   GROUP BY 1, 2, 3, 4;
                 """
-
-        records = await ctx.db.fetch(query)
-        value = []
-        for (index, (author_id, uses)) in enumerate(records):
-            user = self.censor_object(self.bot.get_user(
-                author_id) or f'<Unknown {author_id}>')
-            emoji = lookup[index]
-            value.append(f'{emoji}: {user} ({uses} uses)')
-
-        e.add_field(name='Top Users', value='\n'.join(value), inline=False)
-        await message.edit(embed=e, content=None)
+        async with ctx.typing():
+            # hold the batch lock so no flush lands in between
+            async with self._batch_lock:
+                async with ctx.acquire():
+                    async with ctx.db.transaction():
+                        await ctx.db.execute(query)
+        self.invalidate_reports()
+        # the rebuilt days are hourly again, let the next compaction find them
+        self._compacted_until = None
+        await ctx.send(ctx.tick(True, 'Rebuilt the command usage rollups.'))
 
     async def send_guild_stats(self, e: discord.Embed, guild: discord.Guild):
         e.add_field(name='Name', value=guild.name)
@@ -753,6 +1308,17 @@ async def setup(bot):
     if not hasattr(bot, 'socket_stats'):
         bot.socket_stats = Counter()
 
+    if not hasattr(bot, 'command_latency'):
+        bot.command_latency = {}
+
+    if not hasattr(bot, 'gateway_stats'):
+        bot.gateway_stats = GatewayStats()
+
+    if not hasattr(bot, 'counters'):
+        bot.counters = BotCounters()
+        if bot.is_ready():
+            bot.counters.rebuild(bot.guilds)
+
     cog = Stats(bot)
     await bot.add_cog(cog)
 
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Generic, Hashable, Optional, TypeVar
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+_MISSING: Any = object()
+
+
+class ExpiringCache(Generic[K, V]):
+    """A size bounded mapping whose entries expire after ``seconds``.
+
+    Entries are evicted in least recently used order once ``maxsize``
+    is reached, so the memory used never grows past that bound.
+    Hits and misses are counted so they can be surfaced in stats.
+    """
+
+    def __init__(self, seconds: float, *, maxsize: int = 1024):
+        self.ttl: float = seconds
+        self.maxsize: int = maxsize
+        self.hits: int = 0
+        self.misses: int = 0
+        self._data: OrderedDict[K, tuple[V, float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: K) -> bool:
+        return self.get(key, _MISSING, _count=False) is not _MISSING
+
+    def get(self, key: K, default: Any = None, *, _count: bool = True) -> Any:
+        try:
+            value, expires = self._data[key]
+        except KeyError:
+            if _count:
+                self.misses += 1
+            return default
+
+        if time.monotonic() > expires:
+            del self._data[key]
+            if _count:
+                self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        if _count:
+            self.hits += 1
+        return value
+
+    def __setitem__(self, key: K, value: V) -> None:
+        self.set(key, value)
+
+    def set(self, key: K, value: V, *, ttl: Optional[float] = None) -> None:
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (value, expires)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: K, default: Any = None) -> Any:
+        try:
+            value, _ = self._data.pop(key)
+        except KeyError:
+            return default
+        return value
+
+    def invalidate(self, predicate: Callable[[K], bool]) -> int:
+        """Removes every key matching the predicate and returns how many were dropped."""
+        to_remove = [k for k in self._data if predicate(k)]
+        for key in to_remove:
+            del self._data[key]
+        return len(to_remove)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
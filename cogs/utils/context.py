@@ -1,4 +1,4 @@
-from typing import Union
+from typing import Optional, Union
 from discord.ext import commands
 import asyncio
 import discord
@@ -28,6 +28,8 @@ class Context(commands.Context):
         super().__init__(**kwargs)
         self.pool = self.bot.pool
         self._db = None
+        # loop time the command callback started, set by the bot's before_invoke hook
+        self.invoked_at: Optional[float] = None
 
     async def entry_to_code(self, entries):
         width = max(len(a) for a, b in entries)
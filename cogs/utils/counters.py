@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+from typing import Iterable
+
+import discord
+
+
+class BotCounters:
+    """Member, presence, channel and guild totals kept up to date from events.
+
+    Members are counted per guild like ``Client.get_all_members``, so someone
+    in two guilds counts twice. A full walk only happens in :meth:`rebuild`,
+    after that every read is O(1).
+    """
+
+    __slots__ = ('guilds', 'members', 'online', 'text_channels', 'voice_channels')
+
+    def __init__(self) -> None:
+        self.guilds = 0
+        self.members = 0
+        self.online = 0
+        self.text_channels = 0
+        self.voice_channels = 0
+
+    @property
+    def channels(self) -> int:
+        return self.text_channels + self.voice_channels
+
+    def rebuild(self, guilds: Iterable[discord.Guild]) -> None:
+        self.__init__()
+        for guild in guilds:
+            self.add_guild(guild)
+
+    def _guild(self, guild: discord.Guild, sign: int) -> None:
+        self.guilds += sign
+        self.members += sign * len(guild.members)
+        self.online += sign * sum(m.status is not discord.Status.offline for m in guild.members)
+        self.text_channels += sign * len(guild.text_channels)
+        self.voice_channels += sign * len(guild.voice_channels)
+
+    def add_guild(self, guild: discord.Guild) -> None:
+        self._guild(guild, 1)
+
+    def remove_guild(self, guild: discord.Guild) -> None:
+        self._guild(guild, -1)
+
+    def _member(self, member: discord.Member, sign: int) -> None:
+        self.members += sign
+        if member.status is not discord.Status.offline:
+            self.online += sign
+
+    def add_member(self, member: discord.Member) -> None:
+        self._member(member, 1)
+
+    def remove_member(self, member: discord.Member) -> None:
+        self._member(member, -1)
+
+    def update_presence(self, before: discord.Member, after: discord.Member) -> None:
+        was_online = before.status is not discord.Status.offline
+        is_online = after.status is not discord.Status.offline
+        if was_online != is_online:
+            self.online += 1 if is_online else -1
+
+    def _channel(self, channel: discord.abc.GuildChannel, sign: int) -> None:
+        if isinstance(channel, discord.TextChannel):
+            self.text_channels += sign
+        elif isinstance(channel, discord.VoiceChannel):
+            self.voice_channels += sign
+
+    def add_channel(self, channel: discord.abc.GuildChannel) -> None:
+        self._channel(channel, 1)
+
+    def remove_channel(self, channel: discord.abc.GuildChannel) -> None:
+        self._channel(channel, -1)
@@ -12,6 +12,7 @@ file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 from collections import OrderedDict
 from pathlib import Path
+import copy
 import json
 import os
 import pydoc
@@ -22,9 +23,16 @@ import decimal
 import asyncpg
 import logging
 import asyncio
+import time
+
+from .pool import MonitoredPool
 
 log = logging.getLogger(__name__)
 
+# errors meaning the database can't be reached rather than a bad query
+UNREACHABLE = (OSError, asyncio.TimeoutError, asyncpg.PostgresConnectionError,
+               asyncpg.CannotConnectNowError, asyncpg.InterfaceError)
+
 
 class SchemaError(Exception):
     pass
@@ -378,6 +386,261 @@ class PrimaryKeyColumn(Column):
         super().__init__(Integer(auto_increment=True), primary_key=True)
 
 
+class Index:
+    """A table level index over one or more columns.
+
+    Columns may be plain names or expressions such as ``used DESC``.
+    ``where`` turns it into a partial index and ``include`` adds non-key
+    columns so a query can be answered from the index alone.
+    """
+    __slots__ = ('columns', 'include', 'where', 'unique', 'name')
+
+    def __init__(self, *columns, include=(), where=None, unique=False, name=None):
+        if not columns:
+            raise SchemaError('An index needs at least one column.')
+
+        self.columns = list(columns)
+        self.include = list(include)
+        self.where = where
+        self.unique = unique
+        self.name = name  # filled later if not given
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        columns = data.pop('columns')
+        return cls(*columns, **data)
+
+    def _to_dict(self):
+        return {attr: getattr(self, attr) for attr in self.__slots__}
+
+    def _create_index(self, table_name):
+        builder = ['CREATE']
+        if self.unique:
+            builder.append('UNIQUE')
+
+        builder.append('INDEX IF NOT EXISTS')
+        builder.append(self.name)
+        builder.append('ON %s (%s)' % (table_name, ', '.join(self.columns)))
+        if self.include:
+            builder.append('INCLUDE (%s)' % ', '.join(self.include))
+        if self.where:
+            builder.append('WHERE %s' % self.where)
+
+        return ' '.join(builder) + ';'
+
+
+# every Query declared on a table, by its full name
+_queries = OrderedDict()
+
+
+class Query:
+    """A named query declared on a table, e.g. ``recent = db.Query('SELECT ...')``.
+    It's registered as ``<table>.<attribute>`` so it can be looked up and
+    explained by name. Preparing is left to asyncpg's statement cache of
+    the connection it runs on. Each run is timed, runs slower than
+    ``slow`` seconds are logged.
+    """
+    __slots__ = ('sql', 'name', 'slow', 'calls', 'total', 'max')
+
+    SLOW = 0.5
+
+    def __init__(self, sql, *, slow=None):
+        self.sql = sql
+        self.name = None  # filled later
+        self.slow = self.SLOW if slow is None else slow
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def _record(self, elapsed):
+        self.calls += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        if elapsed > self.slow:
+            log.warning('Slow query %s took %.2fms', self.name, elapsed * 1000)
+
+    async def _run(self, connection, method, args):
+        if isinstance(connection, (asyncpg.Pool, MonitoredPool)):
+            async with connection.acquire() as con:
+                return await self._run(con, method, args)
+
+        start = time.perf_counter()
+        try:
+            return await getattr(connection, method)(self.sql, *args)
+        finally:
+            self._record(time.perf_counter() - start)
+
+    async def fetch(self, connection, *args):
+        return await self._run(connection, 'fetch', args)
+
+    async def fetchrow(self, connection, *args):
+        return await self._run(connection, 'fetchrow', args)
+
+    async def fetchval(self, connection, *args):
+        return await self._run(connection, 'fetchval', args)
+
+    async def execute(self, connection, *args):
+        return await self._run(connection, 'execute', args)
+
+    async def executemany(self, connection, args):
+        return await self._run(connection, 'executemany', (args,))
+
+    async def explain(self, connection, *args):
+        """Runs the query under ``EXPLAIN (ANALYZE, BUFFERS)`` and returns the plan.
+        It runs in a transaction that is rolled back, so writes are undone.
+        """
+        tr = connection.transaction()
+        await tr.start()
+        try:
+            records = await connection.fetch('EXPLAIN (ANALYZE, BUFFERS) ' + self.sql, *args)
+        finally:
+            await tr.rollback()
+        return '\n'.join(record[0] for record in records)
+
+    async def parameters(self, connection):
+        """The type names of the query's parameters, in order."""
+        statement = await connection.prepare(self.sql)
+        return [param.name for param in statement.get_parameters()]
+
+
+# Partitioned tables are split into monthly ranges named <table>_pYYYYMM,
+# with a DEFAULT partition catching rows outside of them.
+PARTITIONS_AHEAD = 2
+
+
+def _partition_month(table_name, partition):
+    """Parses the month out of a partition name, ``None`` if it isn't a monthly partition."""
+    prefix = table_name + '_p'
+    if not partition.startswith(prefix):
+        return None
+    try:
+        return datetime.datetime.strptime(partition[len(prefix):], '%Y%m').date()
+    except ValueError:
+        return None
+
+
+def _partitions_sql(table_name, start='NULL', *, ahead=PARTITIONS_AHEAD):
+    """A DO block creating every monthly partition from the month of the
+    ``start`` expression (or now) up to ``ahead`` months from now.
+    """
+    return (
+        "DO $$\n"
+        "DECLARE month timestamp;\n"
+        "BEGIN\n"
+        "    FOR month IN SELECT generate_series(\n"
+        "        date_trunc('month', COALESCE(%(start)s, now() at time zone 'utc')),\n"
+        "        date_trunc('month', now() at time zone 'utc') + INTERVAL '%(ahead)d months',\n"
+        "        INTERVAL '1 month') LOOP\n"
+        "        EXECUTE format('CREATE TABLE IF NOT EXISTS %%I PARTITION OF %(table)s FOR VALUES FROM (%%L) TO (%%L)',\n"
+        "                       '%(table)s_p' || to_char(month, 'YYYYMM'), month, month + INTERVAL '1 month');\n"
+        "    END LOOP;\n"
+        "END\n"
+        "$$;"
+    ) % {'table': table_name, 'start': start, 'ahead': ahead}
+
+
+def _create_table_sql(table_name, columns, indexes, partition_by=None, *, exists_ok=True, partitions_from='NULL'):
+    statements = []
+    builder = ['CREATE TABLE']
+
+    if exists_ok:
+        builder.append('IF NOT EXISTS')
+
+    builder.append(table_name)
+    column_creations = []
+    primary_keys = []
+    for col in columns:
+        column_creations.append(col._create_table())
+        if col.primary_key:
+            primary_keys.append(col.name)
+
+    # postgres requires the partition key to be part of the primary key
+    if partition_by is not None and partition_by not in primary_keys:
+        primary_keys.append(partition_by)
+
+    column_creations.append('PRIMARY KEY (%s)' % ', '.join(primary_keys))
+    builder.append('(%s)' % ', '.join(column_creations))
+    if partition_by is not None:
+        builder.append('PARTITION BY RANGE (%s)' % partition_by)
+    statements.append(' '.join(builder) + ';')
+
+    if partition_by is not None:
+        statements.append('CREATE TABLE IF NOT EXISTS {0}_default PARTITION OF {0} DEFAULT;'.format(table_name))
+        statements.append(_partitions_sql(table_name, partitions_from))
+
+    # handle the index creations
+    for column in columns:
+        if column.index:
+            fmt = 'CREATE INDEX IF NOT EXISTS {1.index_name} ON {0} ({1.name});'.format(
+                table_name, column)
+            statements.append(fmt)
+
+    for index in indexes:
+        statements.append(index._create_index(table_name))
+
+    return '\n'.join(statements)
+
+
+def _rebuild_table_sql(data):
+    """Recreates a table from its dict form while keeping its rows.
+    Changing how a table is partitioned can't be done in place, so the
+    old table is renamed, copied over and dropped.
+    """
+    data = copy.deepcopy(data)
+    name = data['name']
+    old = name + '_old'
+    columns = [Column.from_dict(c) for c in data['columns']]
+    indexes = [Index.from_dict(i) for i in data.get('indexes', [])]
+    partition_by = data.get('partition_by')
+    names = ', '.join(c.name for c in columns)
+
+    statements = ['ALTER TABLE %s RENAME TO %s;' % (name, old)]
+    # the constraints, indexes, sequences and partitions of the old table
+    # keep their names, so get them out of the way of the new table
+    statements.append(
+        "DO $$\n"
+        "DECLARE r record;\n"
+        "BEGIN\n"
+        "    FOR r IN SELECT conname FROM pg_constraint WHERE conrelid = '{0}'::regclass AND contype IN ('p', 'u') LOOP\n"
+        "        EXECUTE format('ALTER TABLE {0} DROP CONSTRAINT %I', r.conname);\n"
+        "    END LOOP;\n"
+        "    FOR r IN SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid\n"
+        "             WHERE i.indrelid = '{0}'::regclass LOOP\n"
+        "        EXECUTE format('DROP INDEX %I', r.relname);\n"
+        "    END LOOP;\n"
+        "    FOR r IN SELECT c.relname FROM pg_depend d JOIN pg_class c ON c.oid = d.objid\n"
+        "             WHERE d.refobjid = '{0}'::regclass AND d.deptype = 'a' AND c.relkind = 'S' LOOP\n"
+        "        EXECUTE format('ALTER SEQUENCE %I RENAME TO %I', r.relname, r.relname || '_old');\n"
+        "    END LOOP;\n"
+        "    FOR r IN SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid\n"
+        "             WHERE i.inhparent = '{0}'::regclass LOOP\n"
+        "        EXECUTE format('ALTER TABLE %I RENAME TO %I', r.relname, r.relname || '_old');\n"
+        "    END LOOP;\n"
+        "END\n"
+        "$$;".format(old)
+    )
+
+    start = 'NULL' if partition_by is None else '(SELECT MIN(%s) FROM %s)' % (partition_by, old)
+    statements.append(_create_table_sql(name, columns, indexes, partition_by,
+                                        exists_ok=False, partitions_from=start))
+    copy_rows = 'INSERT INTO {0} ({1}) SELECT {1} FROM {2}'.format(name, names, old)
+    if partition_by is not None:
+        # the partition key is part of the primary key, so it can't be NULL
+        copy_rows += ' WHERE %s IS NOT NULL' % partition_by
+    statements.append(copy_rows + ';')
+
+    for column in columns:
+        column_type = column.column_type
+        if isinstance(column_type, Integer) and column_type.auto_increment:
+            statements.append(
+                "SELECT setval(pg_get_serial_sequence('{0}', '{1}'), COALESCE(MAX({1}), 0) + 1, false) FROM {0};".format(
+                    name, column.name))
+
+    statements.append('DROP TABLE %s CASCADE;' % old)
+    return '\n'.join(statements)
+
+
 class SchemaDiff:
     __slots__ = ('table', 'upgrade', 'downgrade')
 
@@ -452,13 +715,31 @@ class SchemaDiff:
             statements.append(
                 'DROP INDEX IF EXISTS {0[index]};'.format(dropped))
 
+        for dropped in path.get('drop_indexes', []):
+            statements.append(
+                'DROP INDEX IF EXISTS {0[name]};'.format(dropped))
+
         for added in path.get('add_index', []):
             fmt = 'CREATE INDEX IF NOT EXISTS {0[index]} ON {1.__tablename__} ({0[name]});'
             statements.append(fmt.format(added, self.table))
 
+        for added in path.get('add_indexes', []):
+            index = Index.from_dict(added)
+            statements.append(index._create_index(self.table.__tablename__))
+
+        # this one replaces the whole table so it has to come last
+        rebuild = path.get('rebuild_table')
+        if rebuild is not None:
+            statements.append(_rebuild_table_sql(rebuild))
+
         return '\n'.join(statements)
 
 
+def _as_keys(*names):
+    # column name lists are used as cache keys, so they have to be hashable
+    return tuple(None if n is None else tuple(n) for n in names)
+
+
 class MaybeAcquire:
     def __init__(self, connection, *, pool):
         self.connection = connection
@@ -484,6 +765,8 @@ class TableMeta(type):
 
     def __new__(cls, name, parents, dct, **kwargs):
         columns = []
+        indexes = []
+        queries = {}
 
         try:
             table_name = kwargs['table_name']
@@ -491,6 +774,7 @@ class TableMeta(type):
             table_name = name.lower()
 
         dct['__tablename__'] = table_name
+        dct['__partition__'] = kwargs.get('partition_by')
 
         for elem, value in dct.items():
             if isinstance(value, Column):
@@ -501,8 +785,21 @@ class TableMeta(type):
                     value.index_name = '%s_%s_idx' % (table_name, value.name)
 
                 columns.append(value)
+            elif isinstance(value, Index):
+                if value.name is None:
+                    value.name = '%s_%s_idx' % (table_name, elem)
+
+                indexes.append(value)
+            elif isinstance(value, Query):
+                value.name = '%s.%s' % (table_name, elem)
+                _queries[value.name] = value
+                queries[elem] = value
 
         dct['columns'] = columns
+        dct['indexes'] = indexes
+        dct['queries'] = queries
+        # compiled statements, keyed by the kind of statement and the columns it uses
+        dct['_statements'] = {}
         return super().__new__(cls, name, parents, dct)
 
     def __init__(self, name, parents, dct, **kwargs):
@@ -775,38 +1072,68 @@ class Table(metaclass=TableMeta):
     @classmethod
     def create_table(cls, *, exists_ok=True):
         """Generates the CREATE TABLE stub."""
-        statements = []
-        builder = ['CREATE TABLE']
+        return _create_table_sql(cls.__tablename__, cls.columns, cls.indexes, cls.__partition__,
+                                 exists_ok=exists_ok)
 
-        if exists_ok:
-            builder.append('IF NOT EXISTS')
-
-        builder.append(cls.__tablename__)
-        column_creations = []
-        primary_keys = []
-        for col in cls.columns:
-            column_creations.append(col._create_table())
-            if col.primary_key:
-                primary_keys.append(col.name)
+    @classmethod
+    async def partitions(cls, *, connection=None):
+        """Returns the ``(name, month)`` pairs of the monthly partitions, oldest first."""
+        query = """SELECT c.relname FROM pg_inherits i
+                   JOIN pg_class c ON c.oid = i.inhrelid
+                   WHERE i.inhparent = $1::regclass;
+                """
+        async with MaybeAcquire(connection, pool=cls._pool) as con:
+            records = await con.fetch(query, cls.__tablename__)
 
-        column_creations.append('PRIMARY KEY (%s)' % ', '.join(primary_keys))
-        builder.append('(%s)' % ', '.join(column_creations))
-        statements.append(' '.join(builder) + ';')
+        result = []
+        for record in records:
+            month = _partition_month(cls.__tablename__, record[0])
+            if month is not None:
+                result.append((record[0], month))
+        return sorted(result, key=lambda p: p[1])
 
-        # handle the index creations
-        for column in cls.columns:
-            if column.index:
-                fmt = 'CREATE INDEX IF NOT EXISTS {1.index_name} ON {0} ({1.name});'.format(
-                    cls.__tablename__, column)
-                statements.append(fmt)
+    @classmethod
+    async def create_partitions(cls, *, ahead=PARTITIONS_AHEAD, connection=None):
+        """Makes sure the partitions up to ``ahead`` months from now exist."""
+        if cls.__partition__ is None:
+            raise SchemaError('%s is not partitioned.' % cls.__tablename__)
 
-        return '\n'.join(statements)
+        async with MaybeAcquire(connection, pool=cls._pool) as con:
+            await con.execute(_partitions_sql(cls.__tablename__, ahead=ahead))
 
     @classmethod
-    async def insert(cls, connection=None, **kwargs):
-        """Inserts an element to the table."""
+    async def detach_partitions(cls, before, *, drop=True, connection=None):
+        """Detaches every monthly partition that only holds rows older than ``before``.
+        Unless ``drop`` is ``False`` the detached tables are dropped as well,
+        otherwise they are kept around as standalone tables for archival.
+        Both are catalog operations, no rows are scanned.
+        Returns
+        --------
+        List[str]
+            The names of the detached partitions.
+        """
+        if cls.__partition__ is None:
+            raise SchemaError('%s is not partitioned.' % cls.__tablename__)
 
-        # verify column names:
+        if isinstance(before, datetime.datetime):
+            before = before.date()
+
+        detached = []
+        async with MaybeAcquire(connection, pool=cls._pool) as con:
+            for name, month in await cls.partitions(connection=con):
+                end = (month + datetime.timedelta(days=32)).replace(day=1)
+                if end > before:
+                    break
+
+                async with con.transaction():
+                    await con.execute('ALTER TABLE %s DETACH PARTITION %s;' % (cls.__tablename__, name))
+                    if drop:
+                        await con.execute('DROP TABLE %s;' % name)
+                detached.append(name)
+        return detached
+
+    @classmethod
+    def _verify(cls, kwargs):
         verified = {}
         for column in cls.columns:
             try:
@@ -815,21 +1142,138 @@ class Table(metaclass=TableMeta):
                 continue
 
             check = column.column_type.python
-            if value is None and not column.nullable:
-                raise TypeError(
-                    'Cannot pass None to non-nullable column %s.' % column.name)
+            if value is None:
+                if not column.nullable:
+                    raise TypeError(
+                        'Cannot pass None to non-nullable column %s.' % column.name)
             elif not check or not isinstance(value, check):
                 fmt = 'column {0.name} expected {1.__name__}, received {2.__class__.__name__}'
                 raise TypeError(fmt.format(column, check, value))
 
             verified[column.name] = value
+        return verified
+
+    @classmethod
+    def _column_names(cls, columns):
+        known = {column.name for column in cls.columns}
+        columns = tuple(columns)
+        unknown = [name for name in columns if name not in known]
+        if unknown:
+            raise SchemaError('%s has no column(s) named %s.' % (cls.__tablename__, ', '.join(unknown)))
+        return columns
+
+    @classmethod
+    def _unique_keys(cls):
+        """Every set of columns ON CONFLICT can target, the primary key first."""
+        primary = [c.name for c in cls.columns if c.primary_key]
+        if primary and cls.__partition__ is not None and cls.__partition__ not in primary:
+            primary.append(cls.__partition__)
+
+        keys = [tuple(primary)] if primary else []
+        keys.extend((c.name,) for c in cls.columns if c.unique)
+        keys.extend(tuple(index.columns) for index in cls.indexes if index.unique and not index.where)
+        return keys
+
+    @classmethod
+    def _insert_sql(cls, columns):
+        key = ('insert', columns)
+        try:
+            return cls._statements[key]
+        except KeyError:
+            pass
 
-        sql = 'INSERT INTO {0} ({1}) VALUES ({2});'.format(cls.__tablename__, ', '.join(verified),
-                                                           ', '.join('$' + str(i) for i, _ in enumerate(verified, 1)))
+        sql = 'INSERT INTO {0} ({1}) VALUES ({2});'.format(cls.__tablename__, ', '.join(columns),
+                                                           ', '.join('$' + str(i) for i, _ in enumerate(columns, 1)))
+        cls._statements[key] = sql
+        return sql
+
+    @classmethod
+    def _upsert_sql(cls, columns, conflict, update):
+        key = ('upsert', columns, conflict, update)
+        try:
+            return cls._statements[key]
+        except KeyError:
+            pass
+
+        if conflict is None:
+            keys = cls._unique_keys()
+            if not keys:
+                raise SchemaError('%s has no unique key to upsert on.' % cls.__tablename__)
+            target = keys[0]
+        else:
+            target = cls._column_names(conflict)
+            if set(target) not in [set(k) for k in cls._unique_keys()]:
+                raise SchemaError('%s is not a unique key of %s.' % (', '.join(target), cls.__tablename__))
+
+        if update is None:
+            update = tuple(name for name in columns if name not in target)
+        else:
+            update = cls._column_names(update)
+
+        if update:
+            action = 'UPDATE SET ' + ', '.join('%s = EXCLUDED.%s' % (name, name) for name in update)
+        else:
+            action = 'NOTHING'
+
+        sql = 'INSERT INTO {0} ({1}) VALUES ({2}) ON CONFLICT ({3}) DO {4};'.format(
+            cls.__tablename__, ', '.join(columns), ', '.join('$' + str(i) for i, _ in enumerate(columns, 1)),
+            ', '.join(target), action)
+        cls._statements[key] = sql
+        return sql
+
+    @classmethod
+    async def insert(cls, connection=None, **kwargs):
+        """Inserts an element to the table."""
+        verified = cls._verify(kwargs)
+        sql = cls._insert_sql(tuple(verified))
 
         async with MaybeAcquire(connection, pool=cls._pool) as con:
             await con.execute(sql, *verified.values())
 
+    @classmethod
+    async def insert_many(cls, records, *, columns, connection=None):
+        """Inserts many rows at once through a binary COPY.
+        The column names are checked once for the whole batch, the values
+        are checked by the COPY itself.
+        Parameters
+        -----------
+        records: Iterable[Sequence]
+            The rows, ordered like ``columns``.
+        columns: Sequence[str]
+            The columns the rows are for.
+        Returns
+        --------
+        int
+            How many rows were inserted.
+        """
+        columns = cls._column_names(columns)
+        async with MaybeAcquire(connection, pool=cls._pool) as con:
+            status = await con.copy_records_to_table(cls.__tablename__, records=records, columns=columns)
+        return int(status.split()[-1])
+
+    @classmethod
+    async def upsert(cls, connection=None, *, conflict=None, update=None, **kwargs):
+        """Inserts an element, or updates the row it conflicts with.
+        ``conflict`` is the unique key to conflict on and defaults to the
+        primary key. ``update`` are the columns overwritten on a conflict,
+        by default every given column outside of the key. When it's empty
+        a conflicting row is left alone.
+        """
+        verified = cls._verify(kwargs)
+        sql = cls._upsert_sql(tuple(verified), *_as_keys(conflict, update))
+
+        async with MaybeAcquire(connection, pool=cls._pool) as con:
+            await con.execute(sql, *verified.values())
+
+    @classmethod
+    async def upsert_many(cls, records, *, columns, conflict=None, update=None, connection=None):
+        """Like :meth:`upsert` for many rows ordered like ``columns``, in one round trip."""
+        columns = cls._column_names(columns)
+        sql = cls._upsert_sql(columns, *_as_keys(conflict, update))
+
+        async with MaybeAcquire(connection, pool=cls._pool) as con:
+            await con.executemany(sql, records)
+
     @classmethod
     def to_dict(cls):
         x = {}
@@ -839,6 +1283,8 @@ class Table(metaclass=TableMeta):
         # nb: columns is ordered due to the ordered dict usage
         #     this is used to help detect renames
         x['columns'] = [a._to_dict() for a in cls.columns]
+        x['indexes'] = [a._to_dict() for a in cls.indexes]
+        x['partition_by'] = cls.__partition__
         return x
 
     @classmethod
@@ -853,8 +1299,20 @@ class Table(metaclass=TableMeta):
         self = cls()
         self.__tablename__ = data['name']
         self.columns = [Column.from_dict(a) for a in data['columns']]
+        # older data files predate table level indexes
+        self.indexes = [Index.from_dict(a) for a in data.get('indexes', [])]
+        self.__partition__ = data.get('partition_by')
         return self
 
+    @classmethod
+    def get_query(cls, name):
+        """Returns the query registered as ``<table>.<attribute>``, or ``None``."""
+        return _queries.get(name)
+
+    @classmethod
+    def all_queries(cls):
+        return list(_queries.values())
+
     @classmethod
     def all_tables(cls):
         return cls.__subclasses__()
@@ -884,6 +1342,12 @@ class Table(metaclass=TableMeta):
         add_index:
             name: str [The column name]
             index: str [The index name]
+        drop_indexes:
+            index: object [A table level index]
+        add_indexes:
+            index: object [A table level index]
+        rebuild_table:
+            table: object [The table to recreate and copy the rows into]
         changed_constraints:
             name: str [The column name]
             before:
@@ -1017,6 +1481,34 @@ class Table(metaclass=TableMeta):
             upgrade.setdefault('remove_columns', []).extend(removed)
             downgrade.setdefault('add_columns', []).extend(removed)
 
+        # table level indexes are matched by name, a changed definition
+        # means dropping the old index and creating the new one
+        before_indexes = {i.name: i._to_dict() for i in before.indexes}
+        after_indexes = {i.name: i._to_dict() for i in self.indexes}
+        for name, index in before_indexes.items():
+            if after_indexes.get(name) != index:
+                upgrade.setdefault('drop_indexes', []).append(index)
+                downgrade.setdefault('add_indexes', []).append(index)
+
+        for name, index in after_indexes.items():
+            if before_indexes.get(name) != index:
+                upgrade.setdefault('add_indexes', []).append(index)
+                downgrade.setdefault('drop_indexes', []).append(index)
+
+        # (un)partitioning rebuilds the table from the full definition
+        if self.__partition__ != before.__partition__:
+            def as_dict(table):
+                # to_dict only knows about the class, not the loaded data
+                x = self.to_dict()
+                x['name'] = table.__tablename__
+                x['columns'] = [a._to_dict() for a in table.columns]
+                x['indexes'] = [a._to_dict() for a in table.indexes]
+                x['partition_by'] = table.__partition__
+                return x
+
+            upgrade['rebuild_table'] = as_dict(self)
+            downgrade['rebuild_table'] = as_dict(before)
+
         return SchemaDiff(self, upgrade, downgrade)
 
 
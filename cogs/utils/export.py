@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import asyncio
+import csv
+import gzip
+from typing import Any, Iterable, Optional, Sequence
+
+import asyncpg
+
+
+class CSVExport:
+    """Writes rows into a gzip compressed CSV file.
+
+    Rows are handed over in chunks and written from a thread, so neither
+    the compression nor the disk I/O blocks the event loop.
+    """
+
+    def __init__(self, path: str, columns: Sequence[str]) -> None:
+        self.path = path
+        self.rows = 0
+        self._file = gzip.open(path, 'wt', newline='', encoding='utf-8', compresslevel=6)
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(columns)
+
+    def _write(self, rows: Iterable[Sequence[Any]]) -> None:
+        self._writer.writerows(rows)
+
+    async def write(self, rows: list[Sequence[Any]]) -> None:
+        await asyncio.to_thread(self._write, rows)
+        self.rows += len(rows)
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> CSVExport:
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+
+async def export_query(connection: asyncpg.Connection, path: str, query: str, *args: Any,
+                       chunk: int = 5000, timeout: Optional[float] = None) -> int:
+    """Streams the result of ``query`` into ``path`` through a server side cursor.
+
+    Only ``chunk`` rows are held in memory at a time. The cursor runs in a
+    read only repeatable read transaction, so the export is a consistent
+    snapshot and takes no locks beyond what a plain SELECT takes.
+    Returns how many rows were written.
+    """
+    async with connection.transaction(isolation='repeatable_read', readonly=True):
+        statement = await connection.prepare(query, timeout=timeout)
+        cursor = await statement.cursor(*args, timeout=timeout)
+        with CSVExport(path, [attr.name for attr in statement.get_attributes()]) as export:
+            while True:
+                rows = await cursor.fetch(chunk, timeout=timeout)
+                if not rows:
+                    break
+                await export.write([tuple(row) for row in rows])
+            return export.rows
+
+
+def human_size(size: float) -> str:
+    for unit in ('B', 'KiB', 'MiB'):
+        if size < 1024:
+            return f'{size:.2f} {unit}'
+        size /= 1024
+    return f'{size:.2f} GiB'
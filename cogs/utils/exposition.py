@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import math
+from typing import Iterable, List, Mapping, Optional, Sequence, Set, Tuple
+
+# Writer for the Prometheus text exposition format (version 0.0.4).
+# https://prometheus.io/docs/instrumenting/exposition_formats/
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+Labels = Mapping[str, object]
+
+
+def _escape(value: object) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class BoundedLabel:
+    """Keeps a label to at most ``limit`` values, anything past them is folded into ``other``.
+
+    Values are admitted as they're first seen, largest first, and stay admitted
+    for good, only new values past the limit are folded. A value never moves
+    between its own series and ``other``, so counters exported through it
+    stay monotonic.
+    """
+
+    def __init__(self, limit: int, *, other: str = 'other') -> None:
+        self.limit = limit
+        self.other = other
+        self.admitted: Set[str] = set()
+
+    def admit(self, value: str) -> bool:
+        if value in self.admitted:
+            return True
+        if len(self.admitted) < self.limit:
+            self.admitted.add(value)
+            return True
+        return False
+
+    def fold(self, items: Iterable[Tuple[str, float]]) -> List[Tuple[str, float]]:
+        kept = []
+        rest = 0.0
+        for key, value in sorted(items, key=lambda t: t[1], reverse=True):
+            if self.admit(key):
+                kept.append((key, value))
+            else:
+                rest += value
+        if rest:
+            kept.append((self.other, rest))
+        return kept
+
+
+class Exposition:
+    def __init__(self, prefix: str = '') -> None:
+        self.prefix = prefix
+        self._lines: List[str] = []
+
+    def _sample(self, name: str, labels: Optional[Labels], value: float) -> None:
+        if labels:
+            inner = ','.join(f'{key}="{_escape(v)}"' for key, v in labels.items())
+            self._lines.append(f'{name}{{{inner}}} {_number(value)}')
+        else:
+            self._lines.append(f'{name} {_number(value)}')
+
+    def metric(self, name: str, kind: str, help: str, samples: Iterable[Tuple[Optional[Labels], float]]) -> None:
+        """Adds a counter or gauge with its ``(labels, value)`` samples."""
+        name = self.prefix + name
+        self._lines.append(f'# HELP {name} {help}')
+        self._lines.append(f'# TYPE {name} {kind}')
+        for labels, value in samples:
+            self._sample(name, labels, value)
+
+    def histogram(self, name: str, help: str,
+                  series: Iterable[Tuple[Optional[Labels], Sequence[Tuple[float, int]], float]]) -> None:
+        """Adds a histogram, every series is ``(labels, [(upper bound, count)], sum)``.
+        The counts are per bucket, they're made cumulative here.
+        """
+        name = self.prefix + name
+        self._lines.append(f'# HELP {name} {help}')
+        self._lines.append(f'# TYPE {name} histogram')
+        for labels, buckets, total in series:
+            labels = dict(labels or {})
+            cumulative = 0
+            for bound, count in buckets:
+                cumulative += count
+                self._sample(f'{name}_bucket', {**labels, 'le': _number(bound)}, cumulative)
+            if not buckets or not math.isinf(buckets[-1][0]):
+                self._sample(f'{name}_bucket', {**labels, 'le': '+Inf'}, cumulative)
+            self._sample(f'{name}_sum', labels, total)
+            self._sample(f'{name}_count', labels, cumulative)
+
+    def render(self) -> str:
+        return '\n'.join(self._lines) + '\n'
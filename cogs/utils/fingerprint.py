@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import hashlib
+import time
+import traceback
+from collections import Counter, OrderedDict
+from typing import Iterator, Optional
+
+
+def fingerprint(error: BaseException) -> str:
+    """Identifies an error by its type and the frames it was raised through.
+
+    The message is left out on purpose, it usually carries ids or status
+    codes that would split otherwise identical failures apart.
+    """
+    exc_type = type(error)
+    parts = [f'{exc_type.__module__}.{exc_type.__qualname__}']
+    for frame in traceback.extract_tb(error.__traceback__):
+        parts.append(f'{frame.filename}:{frame.name}:{frame.lineno}')
+    return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()[:16]
+
+
+class ErrorGroup:
+    """Every occurrence of one fingerprint, and where it happened."""
+
+    # guilds are only remembered up to this many, past that they're just counted
+    MAX_GUILDS = 25
+
+    __slots__ = ('fingerprint', 'exc_type', 'message', 'first_seen', 'last_seen', 'count',
+                 'reported', 'saved', 'commands', 'guilds', 'extra_guilds')
+
+    def __init__(self, fingerprint: str, error: BaseException) -> None:
+        self.fingerprint = fingerprint
+        self.exc_type = type(error).__name__
+        self.message = str(error)
+        self.first_seen = self.last_seen = time.time()
+        self.count = 0
+        # how many of count were posted or summarised, and written to the history
+        self.reported = 0
+        self.saved = 0
+        self.commands: Counter[str] = Counter()
+        self.guilds: set[int] = set()
+        self.extra_guilds = 0
+
+    @property
+    def unreported(self) -> int:
+        return self.count - self.reported
+
+    def add(self, error: BaseException, command: str, guild_id: Optional[int]) -> None:
+        self.count += 1
+        self.last_seen = time.time()
+        self.message = str(error)
+        self.commands[command] += 1
+        if guild_id is not None and guild_id not in self.guilds:
+            if len(self.guilds) < self.MAX_GUILDS:
+                self.guilds.add(guild_id)
+            else:
+                self.extra_guilds += 1
+
+    @property
+    def guild_count(self) -> int:
+        return len(self.guilds) + self.extra_guilds
+
+
+class ErrorTracker:
+    """Groups errors by :func:`fingerprint` in bounded memory.
+
+    At most ``maxsize`` groups are kept, the least recently seen one is
+    evicted first. A group that hasn't been seen for ``forget`` seconds is
+    started over, so an old failure coming back is reported as new again.
+    """
+
+    def __init__(self, *, maxsize: int = 256, forget: float = 86400.0) -> None:
+        self.maxsize = maxsize
+        self.forget = forget
+        self._groups: OrderedDict[str, ErrorGroup] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._groups)
+
+    def __iter__(self) -> Iterator[ErrorGroup]:
+        return iter(self._groups.values())
+
+    def record(self, error: BaseException, command: str, guild_id: Optional[int]) -> tuple[ErrorGroup, bool]:
+        """Adds an occurrence, returns its group and whether it's the first one."""
+        key = fingerprint(error)
+        group = self._groups.get(key)
+        new = False
+        if group is None or time.time() - group.last_seen > self.forget:
+            group = self._groups[key] = ErrorGroup(key, error)
+            new = True
+        self._groups.move_to_end(key)
+
+        group.add(error, command, guild_id)
+        while len(self._groups) > self.maxsize:
+            self._groups.popitem(last=False)
+        return group, new
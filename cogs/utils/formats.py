@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import datetime
 
-from typing import Any, Iterable, Optional, Sequence
+from typing import Any, Callable, Iterable, Optional, Sequence
 
 
 class plural:
@@ -84,6 +84,31 @@ class TabularData:
         return '\n'.join(to_draw)
 
 
+def text_chart(values: Sequence[float], *, height: int = 8, label: Callable[[float], str] = str) -> str:
+    """Renders the values as a block chart, one column per value.
+    The top and bottom rows are labelled with the highest and lowest value.
+    """
+    blocks = ' \u2581\u2582\u2583\u2584\u2585\u2586\u2587\u2588'
+    low, high = min(values), max(values)
+    span = (high - low) or 1
+    # every cell is split in 8 sub levels, the lowest value still gets one
+    scaled = [(v - low) / span * (height * 8 - 1) + 1 for v in values]
+
+    top, bottom = label(high), label(low)
+    width = max(len(top), len(bottom))
+    lines = []
+    for row in range(height - 1, -1, -1):
+        cells = ''.join(blocks[max(0, min(8, int(s - row * 8)))] for s in scaled)
+        if row == height - 1:
+            axis = top
+        elif row == 0:
+            axis = bottom
+        else:
+            axis = ''
+        lines.append(f'{axis:>{width}} \u2502{cells}')
+    return '\n'.join(lines)
+
+
 def format_dt(dt: datetime.datetime, style: Optional[str] = None) -> str:
     if dt.tzinfo is None:
         dt = dt.replace(tzinfo=datetime.timezone.utc)
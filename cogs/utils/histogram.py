@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import math
+from typing import Iterable, List, Optional
+
+# Durations are bucketed on a log scale: bucket 0 holds everything under 1ms,
+# bucket i holds [BASE ** (i - 1), BASE ** i) milliseconds and the last one
+# everything above. With a base of 1.25 a percentile is off by at most 25%,
+# and a histogram is always BUCKETS integers no matter how much it records.
+BASE = 1.25
+BUCKETS = 64
+
+_LOG_BASE = math.log(BASE)
+
+
+def bucket_for(milliseconds: float) -> int:
+    if milliseconds < 1.0:
+        return 0
+    return min(BUCKETS - 1, int(math.log(milliseconds) / _LOG_BASE) + 1)
+
+
+def upper_bound(bucket: int) -> float:
+    """The upper bound in milliseconds of a bucket."""
+    return BASE ** bucket
+
+
+class LatencyHistogram:
+    __slots__ = ('counts', 'count', 'total')
+
+    def __init__(self, counts: Optional[Iterable[int]] = None) -> None:
+        self.counts: List[int] = list(counts) if counts is not None else [0] * BUCKETS
+        if len(self.counts) != BUCKETS:
+            # stored with a different bucket count, pad or fold the tail
+            counts = self.counts[:BUCKETS] + [0] * (BUCKETS - len(self.counts))
+            counts[-1] += sum(self.counts[BUCKETS:])
+            self.counts = counts
+        self.count = sum(self.counts)
+        # sum of the recorded durations in seconds, unknown for loaded counts
+        self.total = 0.0
+
+    def __bool__(self) -> bool:
+        return self.count > 0
+
+    def record(self, seconds: float) -> None:
+        self.counts[bucket_for(seconds * 1000.0)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def merge(self, other: LatencyHistogram) -> None:
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+
+    def quantile(self, q: float) -> float:
+        """The upper bound in milliseconds of the bucket the ``q`` quantile falls in."""
+        if self.count == 0:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return upper_bound(bucket)
+        return upper_bound(BUCKETS - 1)
+
+    def summary(self) -> str:
+        return f'p50 {self.quantile(0.5):.0f}ms, p95 {self.quantile(0.95):.0f}ms, p99 {self.quantile(0.99):.0f}ms'
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Awaitable, Callable, Deque, List, NamedTuple, Optional
+
+# upper bounds of the lag histogram buckets, in milliseconds
+LAG_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float('inf'))
+
+
+class Stall(NamedTuple):
+    started: float  # time.time()
+    duration: float  # seconds, how long the loop was blocked in total
+    stack: str  # what the loop thread was running when the watchdog noticed
+
+
+class LoopMonitor:
+    """Measures how late the event loop wakes up from a short sleep.
+
+    Lag is recorded into a fixed bucket histogram. A watchdog thread checks
+    the heartbeat of the monitor task, once it is more than ``threshold``
+    seconds late it grabs the stack of the loop thread, so whatever is
+    blocking shows up in the report rather than just the fact it happened.
+    """
+
+    def __init__(self, *, interval: float = 0.5, threshold: float = 0.25, history: int = 20,
+                 on_stall: Optional[Callable[[Stall], Awaitable[None]]] = None) -> None:
+        self.interval = interval
+        self.threshold = threshold
+        self.on_stall = on_stall
+        self.counts: List[int] = [0] * len(LAG_BUCKETS)
+        self.samples = 0
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+        self.total_lag = 0.0
+        self.stalls: Deque[Stall] = deque(maxlen=history)
+
+        self._task: Optional[asyncio.Task[None]] = None
+        # the loop only keeps weak references to tasks, the on_stall ones are kept here until done
+        self._reports: set[asyncio.Task[None]] = set()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._heartbeat = time.monotonic()
+        self._loop_thread: Optional[int] = None
+        # (started, stack) of the stall currently in progress, set by the watchdog
+        self._pending: Optional[tuple[float, str]] = None
+
+    def start(self) -> None:
+        """Starts monitoring the running loop, must be called from its thread."""
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._run())
+        self._thread = threading.Thread(target=self._watchdog, name='loop-watchdog', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    def record(self, lag: float) -> None:
+        self.samples += 1
+        self.last_lag = lag
+        self.total_lag += lag
+        self.max_lag = max(self.max_lag, lag)
+        self.counts[bisect.bisect_left(LAG_BUCKETS, lag * 1000)] += 1
+
+    def percentile(self, q: float) -> float:
+        """Upper bound in milliseconds of the bucket the ``q`` percentile falls in."""
+        if self.samples == 0:
+            return 0.0
+        rank = q * self.samples
+        seen = 0
+        for bound, count in zip(LAG_BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound if bound != float('inf') else self.max_lag * 1000
+        return self.max_lag * 1000
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            self._heartbeat = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            self._heartbeat = time.monotonic()
+            self.record(lag)
+
+            pending, self._pending = self._pending, None
+            if pending is not None:
+                stall = Stall(pending[0], lag, pending[1])
+                self.stalls.append(stall)
+                if self.on_stall is not None:
+                    task = asyncio.create_task(self.on_stall(stall))
+                    self._reports.add(task)
+                    task.add_done_callback(self._reports.discard)
+
+    def _watchdog(self) -> None:
+        captured_for = None
+        while not self._stopped.wait(self.threshold / 2):
+            heartbeat = self._heartbeat
+            late = time.monotonic() - heartbeat - self.interval
+            if late < self.threshold or captured_for == heartbeat:
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+
+            stack = ''.join(traceback.format_stack(frame))
+            self._pending = (time.time() - late, stack)
+            captured_for = heartbeat
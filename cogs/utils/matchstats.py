@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from typing import List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+# column order of the rows produced by summarise and stored in match_summaries
+COLUMNS = ('puuid', 'match_id', 'played', 'queue_id', 'champion', 'role', 'win',
+           'kills', 'deaths', 'assists', 'cs', 'duration', 'damage', 'team_damage')
+
+
+def summarise(match, puuid: str) -> Optional[tuple]:
+    """Flattens the participant ``puuid`` of a match into a match_summaries row."""
+    participants = match.info.participants
+    me = next((p for p in participants if p.puuid == puuid), None)
+    if me is None:
+        return None
+
+    team_damage = sum(p.total_damage_dealt_to_champions for p in participants if p.team_id == me.team_id)
+    played = match.info.creation
+    if isinstance(played, datetime) and played.tzinfo is not None:
+        played = played.astimezone(timezone.utc).replace(tzinfo=None)
+    duration = match.info.duration
+    if isinstance(duration, timedelta):
+        duration = duration.total_seconds()
+
+    return (
+        puuid,
+        match.id,
+        played,
+        match.info.queue_id,
+        me.champion_name,
+        me.team_position or None,
+        me.win,
+        me.kills,
+        me.deaths,
+        me.assists,
+        me.total_minions_killed + me.neutral_minions_killed,
+        int(duration),
+        me.total_damage_dealt_to_champions,
+        team_damage,
+    )
+
+
+class Aggregate(NamedTuple):
+    key: str
+    games: int
+    winrate: float
+    kda: float
+    cs_per_min: float
+    damage_share: float
+
+
+class MatchFrame:
+    """Columnar view over the stored match summaries of a single player.
+
+    Every aggregate is computed with grouped NumPy reductions instead of
+    looping over the matches in Python.
+    """
+
+    def __init__(self, records: Sequence) -> None:
+        self.size = len(records)
+        self.champion = np.array([r['champion'] for r in records], dtype=object)
+        self.role = np.array([r['role'] or 'NONE' for r in records], dtype=object)
+        self.win = np.fromiter((r['win'] for r in records), dtype=np.float64, count=self.size)
+        self.kills = np.fromiter((r['kills'] for r in records), dtype=np.float64, count=self.size)
+        self.deaths = np.fromiter((r['deaths'] for r in records), dtype=np.float64, count=self.size)
+        self.assists = np.fromiter((r['assists'] for r in records), dtype=np.float64, count=self.size)
+        self.cs = np.fromiter((r['cs'] for r in records), dtype=np.float64, count=self.size)
+        self.minutes = np.fromiter((r['duration'] for r in records), dtype=np.float64, count=self.size) / 60.0
+        damage = np.fromiter((r['damage'] for r in records), dtype=np.float64, count=self.size)
+        team_damage = np.fromiter((r['team_damage'] for r in records), dtype=np.float64, count=self.size)
+        self.damage_share = np.divide(damage, team_damage, out=np.zeros_like(damage), where=team_damage > 0)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def group(self, keys: np.ndarray) -> List[Aggregate]:
+        """Aggregates every stat per unique key, most played first."""
+        if self.size == 0:
+            return []
+
+        labels, inverse, games = np.unique(keys, return_inverse=True, return_counts=True)
+        n = len(labels)
+
+        def total(values: np.ndarray) -> np.ndarray:
+            return np.bincount(inverse, weights=values, minlength=n)
+
+        wins = total(self.win)
+        takedowns = total(self.kills + self.assists)
+        deaths = total(self.deaths)
+        cs = total(self.cs)
+        minutes = total(self.minutes)
+        share = total(self.damage_share)
+
+        kda = takedowns / np.maximum(deaths, 1.0)
+        cs_per_min = np.divide(cs, minutes, out=np.zeros_like(cs), where=minutes > 0)
+
+        order = np.argsort(-games, kind='stable')
+        return [
+            Aggregate(str(labels[i]), int(games[i]), float(wins[i] / games[i]), float(kda[i]),
+                      float(cs_per_min[i]), float(share[i] / games[i]))
+            for i in order
+        ]
+
+    def by_champion(self) -> List[Aggregate]:
+        return self.group(self.champion)
+
+    def by_role(self) -> List[Aggregate]:
+        return self.group(self.role)
+
+    def overall(self) -> Optional[Aggregate]:
+        if self.size == 0:
+            return None
+        return self.group(np.full(self.size, 'ALL', dtype=object))[0]
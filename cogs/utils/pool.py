@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import asyncio
+import time
+import traceback
+from contextvars import ContextVar
+from typing import Any, Optional
+
+import asyncpg
+
+from .histogram import LatencyHistogram
+
+# what connections acquired in the current task are attributed to, the bot
+# sets it to the command name right before a command callback runs. Tasks
+# copy it when they're created, so loops that can be started from a command
+# (restart(), reloading the extension) reset it at the top of their body
+BACKGROUND = 'background'
+pool_label: ContextVar[str] = ContextVar('pool_label', default=BACKGROUND)
+# set alongside it for commands that are expected to hold a connection for
+# a long time, like exports, so they aren't reported as leaks
+long_running: ContextVar[bool] = ContextVar('long_running', default=False)
+
+
+class Checkout:
+    """A connection that is currently acquired."""
+
+    __slots__ = ('started', 'label', 'task', 'reported', 'long_running')
+
+    def __init__(self, label: str, task: Optional[asyncio.Task[Any]], *, long_running: bool = False) -> None:
+        self.started = time.monotonic()
+        self.label = label
+        self.task = task
+        self.reported = False
+        self.long_running = long_running
+
+    @property
+    def held(self) -> float:
+        return time.monotonic() - self.started
+
+    def stack(self, limit: int = 10) -> str:
+        """Where the task holding the connection is currently suspended."""
+        if self.task is None or self.task.done():
+            return 'The task holding it is gone, the connection was never released.\n'
+        frames = self.task.get_stack(limit=limit)
+        summary = traceback.StackSummary.extract((frame, frame.f_lineno) for frame in frames)
+        return ''.join(summary.format())
+
+
+class _PoolAcquire:
+    __slots__ = ('pool', 'timeout', 'connection')
+
+    def __init__(self, pool: MonitoredPool, timeout: Optional[float]) -> None:
+        self.pool = pool
+        self.timeout = timeout
+        self.connection = None
+
+    def __await__(self):
+        return self.pool._acquire(self.timeout).__await__()
+
+    async def __aenter__(self) -> asyncpg.Connection:
+        self.connection = await self.pool._acquire(self.timeout)
+        return self.connection
+
+    async def __aexit__(self, *args) -> None:
+        await self.pool.release(self.connection)
+
+
+class MonitoredPool:
+    """Wraps an asyncpg pool to see how the connections are used.
+
+    Records how long acquiring a connection waits, how long each one is
+    held per :data:`pool_label` and which are held past ``leak_threshold``
+    seconds. Anything not overridden here is forwarded to the pool.
+
+    asyncpg can't resize a pool once it's created, so its size adapts
+    through the bounds it was created with: connections are opened on
+    demand up to ``max_size`` and the ones idle for longer than
+    ``max_inactive_connection_lifetime`` are closed, down to ``min_size``.
+    """
+
+    def __init__(self, pool: asyncpg.Pool, *, leak_threshold: float = 30.0) -> None:
+        self.pool = pool
+        self.leak_threshold = leak_threshold
+        self.wait = LatencyHistogram()
+        self.held: dict[str, LatencyHistogram] = {}
+        self.timeouts = 0
+        # the most connections ever checked out at once
+        self.peak = 0
+        self._checkouts: dict[int, Checkout] = {}
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.pool, name)
+
+    @property
+    def checked_out(self) -> int:
+        return len(self._checkouts)
+
+    def acquire(self, *, timeout: Optional[float] = None) -> _PoolAcquire:
+        return _PoolAcquire(self, timeout)
+
+    async def _acquire(self, timeout: Optional[float]) -> asyncpg.Connection:
+        start = time.perf_counter()
+        try:
+            connection = await self.pool.acquire(timeout=timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            self.wait.record(time.perf_counter() - start)
+
+        checkout = Checkout(pool_label.get(), asyncio.current_task(), long_running=long_running.get())
+        self._checkouts[id(connection)] = checkout
+        self.peak = max(self.peak, len(self._checkouts))
+        return connection
+
+    async def release(self, connection: asyncpg.Connection, *, timeout: Optional[float] = None) -> None:
+        checkout = self._checkouts.pop(id(connection), None)
+        if checkout is not None:
+            held = self.held.get(checkout.label)
+            if held is None:
+                held = self.held[checkout.label] = LatencyHistogram()
+            held.record(checkout.held)
+        await self.pool.release(connection, timeout=timeout)
+
+    def leaks(self) -> list[Checkout]:
+        """The connections held past the leak threshold, longest first.
+        Those held by a :data:`long_running` command aren't counted.
+        """
+        leaked = [c for c in self._checkouts.values() if not c.long_running and c.held > self.leak_threshold]
+        return sorted(leaked, key=lambda c: c.started)
+
+    # the shortcuts acquire through the wrapper so they're counted as well
+
+    async def execute(self, query: str, *args: Any, timeout: Optional[float] = None) -> str:
+        async with self.acquire() as con:
+            return await con.execute(query, *args, timeout=timeout)
+
+    async def executemany(self, command: str, args: Any, *, timeout: Optional[float] = None) -> None:
+        async with self.acquire() as con:
+            return await con.executemany(command, args, timeout=timeout)
+
+    async def fetch(self, query: str, *args: Any, timeout: Optional[float] = None) -> list[asyncpg.Record]:
+        async with self.acquire() as con:
+            return await con.fetch(query, *args, timeout=timeout)
+
+    async def fetchrow(self, query: str, *args: Any, timeout: Optional[float] = None) -> Optional[asyncpg.Record]:
+        async with self.acquire() as con:
+            return await con.fetchrow(query, *args, timeout=timeout)
+
+    async def fetchval(self, query: str, *args: Any, column: int = 0, timeout: Optional[float] = None) -> Any:
+        async with self.acquire() as con:
+            return await con.fetchval(query, *args, column=column, timeout=timeout)
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import time
+from collections import Counter, defaultdict
+from typing import DefaultDict, Optional
+
+
+class RollingCounter:
+    """Counts events over a sliding window in fixed memory.
+
+    The window is split into ``span / resolution`` slots used as a ring,
+    every slot remembers which time step it belongs to so stale slots are
+    reset lazily when they're written to or skipped when read.
+    """
+
+    __slots__ = ('resolution', 'size', 'slots', 'steps', 'total')
+
+    def __init__(self, *, span: int = 3600, resolution: int = 10) -> None:
+        self.resolution = resolution
+        self.size = span // resolution
+        self.slots = [0] * self.size
+        self.steps = [-1] * self.size
+        self.total = 0
+
+    def add(self, amount: int = 1, *, now: Optional[float] = None) -> None:
+        step = int((time.monotonic() if now is None else now) // self.resolution)
+        index = step % self.size
+        if self.steps[index] != step:
+            self.steps[index] = step
+            self.slots[index] = 0
+        self.slots[index] += amount
+        self.total += amount
+
+    def count(self, seconds: int, *, now: Optional[float] = None) -> int:
+        """How much was added in the last ``seconds``, rounded up to whole slots."""
+        step = int((time.monotonic() if now is None else now) // self.resolution)
+        slots = min(self.size, max(1, -(-seconds // self.resolution)))
+        total = 0
+        for past in range(step - slots + 1, step + 1):
+            index = past % self.size
+            if self.steps[index] == past:
+                total += self.slots[index]
+        return total
+
+
+def _event_name(payload: str) -> str:
+    # "t" comes first in dispatch payloads, so only look at the start
+    # instead of decoding every message just to account for it
+    start = payload.find('"t":"', 0, 64)
+    if start == -1:
+        return 'GATEWAY'
+    start += 5
+    end = payload.find('"', start, start + 64)
+    return payload[start:end] if end != -1 else 'GATEWAY'
+
+
+class GatewayStats:
+    """Gateway events and received bytes per event type and per shard."""
+
+    WINDOWS = {'1m': 60, '5m': 300, '1h': 3600}
+
+    def __init__(self) -> None:
+        self.events: DefaultDict[str, RollingCounter] = defaultdict(RollingCounter)
+        self.bytes: DefaultDict[str, RollingCounter] = defaultdict(RollingCounter)
+        self.shards: DefaultDict[int, RollingCounter] = defaultdict(RollingCounter)
+        self.shard_bytes: Counter[int] = Counter()
+
+    def event(self, event_type: str, shard_id: int) -> None:
+        self.events[event_type].add()
+        self.shards[shard_id].add()
+
+    def received(self, payload: str | bytes, shard_id: int) -> None:
+        # decoded messages are counted by length, close enough to bytes for JSON
+        if isinstance(payload, bytes):
+            size = len(payload)
+            payload = payload[:128].decode('utf-8', 'ignore')
+        else:
+            size = len(payload)
+        self.bytes[_event_name(payload)].add(size)
+        self.shard_bytes[shard_id] += size
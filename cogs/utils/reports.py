@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import datetime
+from collections import defaultdict
+from typing import TYPE_CHECKING, Any, Callable, Optional
+
+if TYPE_CHECKING:
+    from .db import Query
+
+# Every usage report is a single query: each leaderboard is a parenthesised
+# top 5 subquery over the hourly rollups, glued together with UNION ALL and
+# tagged with the section it belongs to and the rank within it. UNION ALL
+# doesn't keep the order of its branches, so the rows are sorted by those at
+# the end. This way a report costs one round trip instead of one per leaderboard. They're registered as db.Query on the
+# rollup tables in cogs.stats.
+
+MEDALS = (
+    '\N{FIRST PLACE MEDAL}',
+    '\N{SECOND PLACE MEDAL}',
+    '\N{THIRD PLACE MEDAL}',
+    '\N{SPORTS MEDAL}',
+    '\N{SPORTS MEDAL}',
+)
+
+_TODAY = "bucket >= date_trunc('hour', (now() at time zone 'utc') - INTERVAL '1 day')"
+
+
+def _total(source: str, *, where: Optional[str] = None, failures: bool = False) -> str:
+    clause = f' WHERE {where}' if where else ''
+    fail = 'SUM(failures)::bigint' if failures else 'NULL::bigint'
+    return (f"(SELECT 'total'::text AS section, NULL::text AS key, COALESCE(SUM(uses), 0)::bigint AS uses, "
+            f"{fail} AS failures, MIN(bucket) AS since, 0::bigint AS rank FROM {source}{clause})")
+
+
+def _top(section: str, source: str, key: str, *, where: Optional[str] = None, limit: int = 5) -> str:
+    clause = f' WHERE {where}' if where else ''
+    return (f"(SELECT '{section}'::text, {key}::text, SUM(uses)::bigint, NULL::bigint, NULL::timestamp, "
+            f"row_number() OVER (ORDER BY SUM(uses) DESC, {key}) "
+            f"FROM {source}{clause} GROUP BY {key} ORDER BY 3 DESC, {key} LIMIT {limit})")
+
+
+def _report(*parts: str, scope: Optional[dict[str, str]] = None) -> str:
+    ctes = ''
+    if scope:
+        ctes = 'WITH ' + ', '.join(f'{name} AS ({sql})' for name, sql in scope.items()) + '\n'
+    return ctes + '\nUNION ALL\n'.join(parts) + '\nORDER BY section, rank;'
+
+
+GUILD = _report(
+    _total('cmd'),
+    _top('commands', 'cmd', 'command'),
+    _top('commands_today', 'cmd', 'command', where=_TODAY),
+    _top('authors', 'auth', 'author_id'),
+    _top('authors_today', 'auth', 'author_id', where=_TODAY),
+    scope={
+        'cmd': 'SELECT command, bucket, uses FROM commands_hourly WHERE guild_id=$1',
+        'auth': 'SELECT author_id, bucket, uses FROM command_authors_hourly WHERE guild_id=$1',
+    },
+)
+
+MEMBER = _report(
+    _total('auth'),
+    _top('commands', 'auth', 'command'),
+    _top('commands_today', 'auth', 'command', where=_TODAY),
+    scope={
+        'auth': 'SELECT command, bucket, uses FROM command_authors_hourly WHERE guild_id=$1 AND author_id=$2',
+    },
+)
+
+GLOBAL = _report(
+    _total('commands_hourly'),
+    _top('commands', 'commands_hourly', 'command'),
+    _top('guilds', 'commands_hourly', 'guild_id'),
+    _top('authors', 'command_authors_hourly', 'author_id'),
+)
+
+TODAY = _report(
+    _total('cmd', failures=True),
+    _top('commands', 'cmd', 'command'),
+    _top('guilds', 'cmd', 'guild_id'),
+    _top('authors', 'auth', 'author_id'),
+    scope={
+        'cmd': f'SELECT guild_id, command, bucket, uses, failures FROM commands_hourly WHERE {_TODAY}',
+        'auth': f'SELECT author_id, bucket, uses FROM command_authors_hourly WHERE {_TODAY}',
+    },
+)
+
+
+class UsageReport:
+    """The result of one of the report queries, split up per section."""
+
+    def __init__(self, records) -> None:
+        self.total: int = 0
+        self.failures: int = 0
+        self.since: Optional[datetime.datetime] = None
+        self.sections: dict[str, list[tuple[str, int]]] = defaultdict(list)
+        for section, key, uses, failures, since, _rank in records:
+            if section == 'total':
+                self.total = uses
+                self.failures = failures or 0
+                self.since = since
+            else:
+                self.sections[section].append((key, uses))
+
+    @classmethod
+    async def fetch(cls, connection, query: Query, *args: Any) -> UsageReport:
+        return cls(await query.fetch(connection, *args))
+
+    def leaderboard(self, section: str, fmt: Callable[[str, int], str], *, empty: str = 'No Commands.') -> str:
+        """Formats a section as a medal ranking, ``fmt`` receives the key and the uses."""
+        entries = self.sections.get(section, [])
+        return '\n'.join(f'{MEDALS[index]}: {fmt(key, uses)}' for index, (key, uses) in enumerate(entries)) or empty
+
+
+def command_entry(command: str, uses: int) -> str:
+    return f'{command} ({uses} uses)'
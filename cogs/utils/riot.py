@@ -1,7 +1,11 @@
+import asyncio
+import re
 import sys
+import time
 import traceback
-from typing import List
+from typing import List, Optional
 from cogs.utils.exceptions import RegionException
+from .cache import ExpiringCache
 from .emotes import get_emote_strings
 from pathlib import Path
 import discord
@@ -39,6 +43,12 @@ INPUT_TO_PLATFORM = {
 }
 
 
+TIERS = ["IRON", "BRONZE", "SILVER", "GOLD", "PLATINUM", "DIAMOND",
+         "MASTER", "GRANDMASTER", "CHALLENGER"]
+DIVISIONS = ["IV", "III", "II", "I"]
+APEX_TIERS = ("MASTER", "GRANDMASTER", "CHALLENGER")
+
+
 class StaticData:
     def __init__(self) -> None:
         self.champions_json = None
@@ -80,41 +90,250 @@ class StaticData:
         self.loaded = True
 
 
+class _Bucket:
+    __slots__ = ('rate', 'burst', 'tokens', 'updated', 'semaphore')
+
+    def __init__(self, rate: float, burst: int, concurrency: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    async def take(self) -> float:
+        waited = 0.0
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens +
+                              (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return waited
+            delay = (1 - self.tokens) / self.rate
+            waited += delay
+            await asyncio.sleep(delay)
+
+
+class _Slot:
+    __slots__ = ('scheduler', 'bucket')
+
+    def __init__(self, scheduler, bucket: _Bucket) -> None:
+        self.scheduler = scheduler
+        self.bucket = bucket
+
+    async def __aenter__(self):
+        await self.bucket.semaphore.acquire()
+        try:
+            waited = await self.bucket.take()
+        except BaseException:
+            self.bucket.semaphore.release()
+            raise
+        self.scheduler.requests += 1
+        self.scheduler.waited += waited
+
+    async def __aexit__(self, *args):
+        self.bucket.semaphore.release()
+
+
+class RateScheduler:
+    """Spreads Riot API calls over a token bucket per routing value.
+
+    pyot already backs off once we receive a 429, this keeps commands
+    that fan out (lobbies, leaderboards) from bursting the key in the
+    first place. Use it around every call that actually hits the API::
+
+        async with scheduler.slot(platform):
+            await lol.Summoner(name=name, platform=platform).get()
+    """
+
+    def __init__(self, *, rate: float = 15.0, burst: int = 20, concurrency: int = 10) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.requests = 0
+        self.waited = 0.0
+        self._buckets: dict[str, _Bucket] = {}
+
+    def slot(self, routing: str) -> _Slot:
+        try:
+            bucket = self._buckets[routing]
+        except KeyError:
+            bucket = self._buckets[routing] = _Bucket(
+                self.rate, self.burst, self.concurrency)
+        return _Slot(self, bucket)
+
+    @property
+    def routings(self) -> list[str]:
+        return list(self._buckets)
+
+    def pending(self, routing: str) -> int:
+        bucket = self._buckets.get(routing)
+        if bucket is None:
+            return 0
+        return self.concurrency - bucket.semaphore._value
+
+
+scheduler = RateScheduler()
+
+# keyed by (platform, lowercased name) and (platform, summoner id)
+summoner_cache: ExpiringCache[tuple[str, str], lol.Summoner] = ExpiringCache(
+    seconds=600.0, maxsize=4096)
+league_cache: ExpiringCache[tuple[str, str], lol.SummonerLeague] = ExpiringCache(
+    seconds=120.0, maxsize=4096)
+
+
+async def fetch_summoner(name: str, platform: str) -> lol.Summoner:
+    """Fetches a summoner by name, going through the cache and scheduler."""
+    key = (platform, name.lower())
+    summoner = summoner_cache.get(key)
+    if summoner is not None:
+        return summoner
+
+    async with scheduler.slot(platform):
+        summoner = await lol.Summoner(name=name, platform=platform).get()
+    summoner_cache[key] = summoner
+    return summoner
+
+
+async def fetch_league_entries(summoner_id: str, platform: str) -> lol.SummonerLeague:
+    """Fetches the ranked entries of a summoner, going through the cache and scheduler."""
+    key = (platform, summoner_id)
+    leagues = league_cache.get(key)
+    if leagues is not None:
+        return leagues
+
+    async with scheduler.slot(platform):
+        leagues = await lol.SummonerLeague(summoner_id=summoner_id, platform=platform).get()
+    league_cache[key] = leagues
+    return leagues
+
+
+def rank_tuple(leagues):
+    solo_rank = 'Unranked'
+    solo_winrate = 'not enough games played'
+    flex_rank = 'Unranked'
+    flex_winrate = 'not enough games played'
+    solo_LP = "0"
+    flex_LP = "0"
+    flex_winrate_compact = None
+    solo_winrate_compact = None
+    for league in leagues:
+        if league.queue == 'RANKED_SOLO_5x5':
+            solo_rank = f'{league["tier"].capitalize()}  {league["rank"]} '
+            solo_winrate = str(league['wins']) + 'W/' + str(league['losses']) + 'L: ' + str(
+                math.ceil(league['wins']/(league['wins']+league['losses'])*100)) + '% WR'
+            solo_LP = league['leaguePoints']
+            solo_winrate_compact = f"{str(math.ceil(league['wins']/(league['wins']+league['losses'])*100))}% {str(league['wins']+league['losses'])}G"
+        if league.queue == 'RANKED_FLEX_SR':
+            flex_rank = f'{league["tier"].capitalize()}  {league["rank"]} '
+            flex_winrate = str(league['wins']) + 'W/' + str(league['losses']) + 'L: ' + str(
+                math.ceil(league['wins']/(league['wins']+league['losses'])*100)) + '% WR'
+            flex_LP = league['leaguePoints']
+            flex_winrate_compact = f"{str(math.ceil(league['wins']/(league['wins']+league['losses'])*100))}% {str(league['wins']+league['losses'])}G"
+    return solo_rank, solo_winrate, flex_rank, flex_winrate, solo_LP, flex_LP, flex_winrate_compact, solo_winrate_compact
+
+
+def solo_entry(leagues):
+    """Returns the solo/duo entry out of the ranked entries, if any."""
+    for league in leagues:
+        if league.queue == 'RANKED_SOLO_5x5':
+            return league
+    return None
+
+
+def rank_score(tier: str, division: str, lp: int) -> int:
+    """Maps a rank onto a single comparable integer.
+
+    Every division is worth 100 LP, apex tiers share a single ladder
+    ordered by LP since they have no divisions.
+    """
+    tier = tier.upper()
+    if tier in APEX_TIERS:
+        return TIERS.index('MASTER') * 400 + lp
+    return TIERS.index(tier) * 400 + DIVISIONS.index(division.upper()) * 100 + lp
+
+
+def score_label(score: int) -> str:
+    """The inverse of :func:`rank_score`, apex tiers are shown as Master+."""
+    master = TIERS.index('MASTER') * 400
+    if score >= master:
+        return f'Master+ {score - master} LP'
+    tier, rest = divmod(score, 400)
+    division, lp = divmod(rest, 100)
+    return f'{TIERS[tier].capitalize()} {DIVISIONS[division]} {lp} LP'
+
+
 async def get_ranks(name: str, region: str):
     try:
         region = verify_region(region)
-        summoner = await lol.Summoner(name=name, platform=region).get()
-        leagues = await summoner.league_entries.get()
-        solo_rank = 'Unranked'
-        solo_winrate = 'not enough games played'
-        flex_rank = 'Unranked'
-        flex_winrate = 'not enough games played'
-        solo_LP = "0"
-        flex_LP = "0"
-        flex_winrate_compact = None
-        solo_winrate_compact = None
-        for league in leagues:
-            if league.queue == 'RANKED_SOLO_5x5':
-                solo_rank = f'{league["tier"].capitalize()}  {league["rank"]} '
-                solo_winrate = str(league['wins']) + 'W/' + str(league['losses']) + 'L: ' + str(
-                    math.ceil(league['wins']/(league['wins']+league['losses'])*100)) + '% WR'
-                solo_LP = league['leaguePoints']
-                solo_winrate_compact = f"{str(math.ceil(league['wins']/(league['wins']+league['losses'])*100))}% {str(league['wins']+league['losses'])}G"
-            if league.queue == 'RANKED_FLEX_SR':
-                flex_rank = f'{league["tier"].capitalize()}  {league["rank"]} '
-                flex_winrate = str(league['wins']) + 'W/' + str(league['losses']) + 'L: ' + str(
-                    math.ceil(league['wins']/(league['wins']+league['losses'])*100)) + '% WR'
-                flex_LP = league['leaguePoints']
-                flex_winrate_compact = f"{str(math.ceil(league['wins']/(league['wins']+league['losses'])*100))}% {str(league['wins']+league['losses'])}G"
+        summoner = await fetch_summoner(name, region)
+        leagues = await fetch_league_entries(summoner.id, region)
+        return rank_tuple(leagues)
     except Exception as e:
         print(e)
         raise
-    return solo_rank, solo_winrate, flex_rank, flex_winrate, solo_LP, flex_LP, flex_winrate_compact, solo_winrate_compact
+
+
+_LOBBY_REGEX = re.compile(
+    r'\s*(?P<name>[^\n,]+?)\s+(?:has\s+)?(?P<action>joined|left)\s+the\s+lobby[.,]?', re.IGNORECASE)
+
+
+def parse_lobby(text: str, *, limit: int = 10) -> List[str]:
+    """Extracts the summoner names out of a pasted champ select lobby.
+
+    Falls back to a newline or comma separated list of names if the
+    text doesn't look like a lobby paste.
+    """
+    names: dict[str, str] = {}
+    matches = list(_LOBBY_REGEX.finditer(text))
+    if matches:
+        for match in matches:
+            name = match.group('name').strip()
+            if match.group('action').lower() == 'left':
+                names.pop(name.lower(), None)
+            else:
+                names.setdefault(name.lower(), name)
+    else:
+        for name in re.split(r'[\n,]', text):
+            name = name.strip()
+            if name:
+                names.setdefault(name.lower(), name)
+    return list(names.values())[:limit]
+
+
+async def get_lobby_ranks(names: List[str], region: str, *, timeout: float = 10.0):
+    """Resolves the summoners and ranks of every name concurrently.
+
+    Returns a list of ``(name, summoner, ranks)`` in the order given where
+    ``summoner`` and ``ranks`` are ``None`` if the lookup failed or didn't
+    finish within ``timeout`` seconds.
+    """
+    region = verify_region(region)
+
+    async def resolve(name: str):
+        summoner = await fetch_summoner(name, region)
+        leagues = await fetch_league_entries(summoner.id, region)
+        return summoner, rank_tuple(leagues)
+
+    tasks = [asyncio.ensure_future(resolve(name)) for name in names]
+    done, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+
+    results = []
+    for name, task in zip(names, tasks):
+        if task in done and task.exception() is None:
+            summoner, ranks = task.result()
+            results.append((name, summoner, ranks))
+        else:
+            results.append((name, None, None))
+    return results
 
 
 async def to_embed(name: str, region: str, data: StaticData, ctx) -> discord.Embed():
     region = verify_region(region)
-    summoner = await lol.Summoner(name=name, platform=region).get()
+    summoner = await fetch_summoner(name, region)
     solo_rank, solo_winrate, flex_rank, flex_winrate, _, _, _, _ = await get_ranks(
         name=name, region=region)
     try:
@@ -271,6 +490,23 @@ async def get_match_ids(name: str, platform: str, queue: int):
     return match_history.ids
 
 
+async def fetch_match_ids(puuid: str, platform: str, *, count: int = 100, queue: Optional[int] = None) -> List[str]:
+    """Fetches the most recent match ids of a puuid through the scheduler."""
+    region = platform_to_region(platform)
+    query = {'count': count}
+    if queue is not None:
+        query['queue'] = queue
+    async with scheduler.slot(region):
+        match_history = await lol.MatchHistory(puuid=puuid, region=region).query(**query).get()
+    return match_history.ids
+
+
+async def fetch_match(match_id: str, platform: str) -> lol.Match:
+    region = platform_to_region(platform)
+    async with scheduler.slot(region):
+        return await lol.Match(id=match_id, region=region).get()
+
+
 def verify_region(region: str):
     if region.lower() not in INPUT_TO_PLATFORM.keys() and region.lower() not in PLATFORMS:
         raise RegionException(region, list(
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import asyncio
+import platform
+import time
+from collections import deque
+from datetime import datetime
+from typing import Deque, List, NamedTuple, Optional
+
+import cpuinfo
+import psutil
+
+
+class HardwareInfo(NamedTuple):
+    system: str
+    node: str
+    release: str
+    version: str
+    machine: str
+    processor: str
+    physical_cores: Optional[int]
+    logical_cores: Optional[int]
+    max_frequency: float
+    min_frequency: float
+    boot_time: datetime
+
+
+class Sample(NamedTuple):
+    taken: float
+    cpu: float
+    cpu_per_core: List[float]
+    frequency: float
+    memory: float
+    memory_used: int
+    memory_total: int
+    rss: int
+    threads: int
+    fds: Optional[int]
+
+
+def _hardware_info() -> HardwareInfo:
+    # cpuinfo spawns a subprocess and can take seconds, so this runs in a thread once
+    uname = platform.uname()
+    frequency = psutil.cpu_freq()
+    return HardwareInfo(
+        system=uname.system,
+        node=uname.node,
+        release=uname.release,
+        version=uname.version,
+        machine=uname.machine,
+        processor=cpuinfo.get_cpu_info().get('brand_raw', uname.processor),
+        physical_cores=psutil.cpu_count(logical=False),
+        logical_cores=psutil.cpu_count(logical=True),
+        max_frequency=frequency.max if frequency else 0.0,
+        min_frequency=frequency.min if frequency else 0.0,
+        boot_time=datetime.fromtimestamp(psutil.boot_time()),
+    )
+
+
+class SystemSampler:
+    """Keeps a rolling window of system and process samples.
+
+    The CPU percentages are measured between two consecutive samples
+    (``interval=None`` in psutil), so taking one never blocks.
+    """
+
+    def __init__(self, process: psutil.Process, *, window: int = 12) -> None:
+        self.process = process
+        self.hardware: Optional[HardwareInfo] = None
+        self.samples: Deque[Sample] = deque(maxlen=window)
+        # the first call only sets the baseline for the next one
+        psutil.cpu_percent(percpu=True)
+        psutil.cpu_percent()
+
+    async def load_hardware(self) -> HardwareInfo:
+        if self.hardware is None:
+            self.hardware = await asyncio.to_thread(_hardware_info)
+        return self.hardware
+
+    def sample(self) -> Sample:
+        memory = psutil.virtual_memory()
+        frequency = psutil.cpu_freq()
+        with self.process.oneshot():
+            rss = self.process.memory_info().rss
+            threads = self.process.num_threads()
+            if hasattr(self.process, 'num_fds'):
+                fds = self.process.num_fds()
+            else:
+                fds = self.process.num_handles()
+
+        sample = Sample(
+            taken=time.monotonic(),
+            cpu=psutil.cpu_percent(),
+            cpu_per_core=psutil.cpu_percent(percpu=True),
+            frequency=frequency.current if frequency else 0.0,
+            memory=memory.percent,
+            memory_used=memory.used,
+            memory_total=memory.total,
+            rss=rss,
+            threads=threads,
+            fds=fds,
+        )
+        self.samples.append(sample)
+        return sample
+
+    @property
+    def latest(self) -> Optional[Sample]:
+        return self.samples[-1] if self.samples else None
+
+    def average(self, attr: str) -> float:
+        """The average of a numeric sample attribute over the window."""
+        if not self.samples:
+            return 0.0
+        return sum(getattr(s, attr) for s in self.samples) / len(self.samples)
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Callable, Iterable, List
+
+# An append-only JSON lines file rows are written to when they can't go to
+# the database. Replaying first renames the file out of the way, so new rows
+# can keep being appended while an old spool is drained, and the position
+# reached is written next to it so a restart picks up where it left off.
+# Lines that can't be decoded are moved to a .corrupt file instead of
+# blocking the replay.
+
+
+class Spool:
+    def __init__(self, path: str | os.PathLike[str], *, encode: Callable[[Any], Any], decode: Callable[[Any], Any]):
+        self.path = Path(path)
+        self.replaying = self.path.with_name(self.path.name + '.replay')
+        self.offset_path = self.path.with_name(self.path.name + '.offset')
+        self.corrupt_path = self.path.with_name(self.path.name + '.corrupt')
+        self.encode = encode
+        self.decode = decode
+        self._lock = threading.Lock()
+        self.written = 0
+        self.replayed = 0
+        self.corrupt = 0
+
+    def __bool__(self) -> bool:
+        return self.replaying.exists() or self.path.exists()
+
+    def size(self) -> int:
+        """The size on disk of everything that still has to be replayed, in bytes."""
+        total = 0
+        for path in (self.path, self.replaying):
+            try:
+                total += path.stat().st_size
+            except FileNotFoundError:
+                pass
+        return total
+
+    def write(self, rows: Iterable[Any]) -> int:
+        """Appends the rows and flushes them to disk. This blocks, so run it in a thread."""
+        lines = [json.dumps(self.encode(row), separators=(',', ':')) + '\n' for row in rows]
+        if not lines:
+            return 0
+
+        with self._lock, self.path.open('a', encoding='utf-8') as fp:
+            fp.writelines(lines)
+            fp.flush()
+            os.fsync(fp.fileno())
+
+        self.written += len(lines)
+        return len(lines)
+
+    def _offset(self) -> int:
+        try:
+            return int(self.offset_path.read_text())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def read(self, limit: int) -> tuple[List[Any], int]:
+        """Returns up to ``limit`` rows to replay and the position after them.
+        Once the rows are stored pass the position to :meth:`commit`.
+        """
+        with self._lock:
+            if not self.replaying.exists():
+                if not self.path.exists():
+                    return [], 0
+                self.path.replace(self.replaying)
+                self.offset_path.unlink(missing_ok=True)
+
+        rows = []
+        corrupt = []
+        with self.replaying.open('rb') as fp:
+            fp.seek(self._offset())
+            while len(rows) < limit:
+                line = fp.readline()
+                if not line:
+                    break
+                if not line.endswith(b'\n'):
+                    # torn write from a crash, skip past it
+                    fp.seek(0, os.SEEK_END)
+                    break
+                try:
+                    rows.append(self.decode(json.loads(line)))
+                except (ValueError, TypeError, KeyError):
+                    corrupt.append(line)
+            position = fp.tell()
+
+        if corrupt:
+            with self.corrupt_path.open('ab') as fp:
+                fp.writelines(corrupt)
+            self.corrupt += len(corrupt)
+
+        return rows, position
+
+    def commit(self, position: int, count: int) -> None:
+        """Marks everything up to ``position`` as stored, removing the file once it's drained."""
+        self.replayed += count
+        if position >= self.replaying.stat().st_size:
+            self.replaying.unlink()
+            self.offset_path.unlink(missing_ok=True)
+        else:
+            self.offset_path.write_text(str(position))
+
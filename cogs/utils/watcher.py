@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import random
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# How often a player is polled for a live game, in seconds.
+# Players that just finished a game are likely queueing up again, so they
+# are polled more often for a while before falling back to idle.
+IDLE = 'idle'
+LOBBY = 'lobby'
+IN_GAME = 'in game'
+
+INTERVALS = {
+    IDLE: 600.0,
+    LOBBY: 120.0,
+    IN_GAME: 180.0,
+}
+
+LOBBY_DURATION = 30 * 60.0
+FINISH_RETRY = 60.0
+FINISH_ATTEMPTS = 5
+# a poll that finishes a game also looks up the match and the new ranks
+FINISH_CALLS = 3
+
+# (channel_id, discord account id)
+Target = Tuple[int, str]
+PlayerKey = Tuple[str, str]
+
+
+class WatchedPlayer:
+    __slots__ = ('summoner_id', 'region', 'puuid', 'name', 'targets', 'state', 'next_poll',
+                 'lobby_until', 'game_id', 'queue_id', 'champion_id', 'pending', 'attempts')
+
+    def __init__(self, summoner_id: str, region: str, puuid: str, name: str) -> None:
+        self.summoner_id = summoner_id
+        self.region = region
+        self.puuid = puuid
+        self.name = name
+        self.targets: Set[Target] = set()
+        self.state = IDLE
+        self.next_poll = 0.0
+        self.lobby_until = 0.0
+        self.game_id: Optional[int] = None
+        self.queue_id: Optional[int] = None
+        self.champion_id: Optional[int] = None
+        # (game_id, queue_id, champion_id) of a game that ended but wasn't announced yet
+        self.pending: Optional[Tuple[int, int, int]] = None
+        self.attempts = 0
+
+    @property
+    def key(self) -> PlayerKey:
+        return (self.summoner_id, self.region)
+
+    def start_game(self, game_id: int, queue_id: int, champion_id: int) -> None:
+        self.state = IN_GAME
+        self.game_id = game_id
+        self.queue_id = queue_id
+        self.champion_id = champion_id
+
+    def end_game(self) -> None:
+        self.pending = (self.game_id, self.queue_id, self.champion_id)
+        self.attempts = 0
+        self.game_id = self.queue_id = self.champion_id = None
+        self.state = LOBBY
+        self.lobby_until = time.monotonic() + LOBBY_DURATION
+
+    def finish(self) -> None:
+        self.pending = None
+        self.attempts = 0
+
+
+class WatchScheduler:
+    """Decides which watched players are due for a poll.
+
+    Every player has its own interval depending on its state. When the
+    combined demand of all players goes over ``budget`` requests per minute
+    every interval is stretched by the same factor, so thousands of players
+    still fit within a single API key.
+
+    Polls of players in a game, or with a finished game still to announce,
+    are counted as :data:`FINISH_CALLS` requests, so a burst of games ending
+    together can't go over the budget.
+    """
+
+    def __init__(self, *, budget: float = 300.0, tick: float = 5.0) -> None:
+        self.budget = budget
+        self.tick = tick
+        self.players: Dict[PlayerKey, WatchedPlayer] = {}
+        self.scale = 1.0
+
+    def __len__(self) -> int:
+        return len(self.players)
+
+    def sync(self, tracked: Iterable[Tuple[str, str, str, str, Target]]) -> None:
+        """Replaces the watch list with ``(summoner_id, region, puuid, name, target)`` rows.
+        Players that are already watched keep their state.
+        """
+        now = time.monotonic()
+        targets: Dict[PlayerKey, Set[Target]] = defaultdict(set)
+        for summoner_id, region, puuid, name, target in tracked:
+            key = (summoner_id, region)
+            targets[key].add(target)
+            player = self.players.get(key)
+            if player is None:
+                player = self.players[key] = WatchedPlayer(summoner_id, region, puuid, name)
+                # spread new players over their first interval
+                player.next_poll = now + random.uniform(0, INTERVALS[IDLE])
+            player.name = name
+
+        for key in list(self.players):
+            if key not in targets:
+                del self.players[key]
+
+        for key, player in self.players.items():
+            player.targets = targets[key]
+
+    @staticmethod
+    def cost(player: WatchedPlayer) -> int:
+        """How many requests polling the player can take."""
+        if player.pending is not None or player.state == IN_GAME:
+            return FINISH_CALLS
+        return 1
+
+    @property
+    def demand(self) -> float:
+        """Requests per minute needed to poll everyone at their base interval."""
+        total = 0.0
+        for player in self.players.values():
+            interval = FINISH_RETRY if player.pending is not None else INTERVALS[player.state]
+            total += 60.0 / interval * self.cost(player)
+        return total
+
+    def interval(self, player: WatchedPlayer) -> float:
+        if player.pending is not None:
+            return FINISH_RETRY
+        return INTERVALS[player.state] * self.scale
+
+    def reschedule(self, player: WatchedPlayer) -> None:
+        now = time.monotonic()
+        if player.state == LOBBY and now > player.lobby_until:
+            player.state = IDLE
+        player.next_poll = now + self.interval(player)
+
+    def due(self) -> Dict[str, List[WatchedPlayer]]:
+        """Returns the players due for a poll, grouped by platform.
+        At most a tick's share of the budget is handed out at once, counted
+        in requests, the rest stays due and is picked up on the next tick.
+        """
+        now = time.monotonic()
+        self.scale = max(1.0, self.demand / self.budget)
+        limit = max(1, int(self.budget * self.tick / 60.0))
+        ready = sorted((p for p in self.players.values() if p.next_poll <= now),
+                       key=lambda p: p.next_poll)
+        batches: Dict[str, List[WatchedPlayer]] = defaultdict(list)
+        for player in ready:
+            cost = self.cost(player)
+            if cost > limit and batches:
+                break
+            limit -= cost
+            # in flight, rescheduled once the poll finished
+            player.next_poll = float('inf')
+            batches[player.region].append(player)
+        return batches
@@ -12,6 +12,7 @@ import os
 import config
 
 from cogs.utils.db import Table
+from cogs.utils.pool import MonitoredPool
 
 from logging.handlers import RotatingFileHandler
 
@@ -98,10 +99,13 @@ class RemoveNoise(logging.Filter):
 
 async def start():
     log = logging.getLogger()
+    # the pool opens connections on demand up to max_size and closes the
+    # ones idle for longer than the inactive lifetime, down to min_size
     kwargs = {
         'command_timeout': 60,
-        'max_size': 20,
-        'min_size': 20,
+        'max_size': getattr(config, 'pool_max_size', 20),
+        'min_size': getattr(config, 'pool_min_size', 4),
+        'max_inactive_connection_lifetime': getattr(config, 'pool_idle_lifetime', 120.0),
     }
     try:
         pool = await Table.create_pool(config.postgresql, **kwargs)
@@ -111,7 +115,7 @@ async def start():
         return
 
     bot = Netero()
-    bot.pool = pool
+    bot.pool = MonitoredPool(pool, leak_threshold=getattr(config, 'pool_leak_threshold', 30.0))
     # discord.py 2.0
     async with aiohttp.ClientSession() as session:
         async with bot: